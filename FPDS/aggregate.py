@@ -1,31 +1,202 @@
-import pandas as pd
-
-file_path = 'output_sttr.xlsx'
+import argparse
+import os
+import sys
 
-data = pd.read_excel(file_path)
-data_copy = data.copy()
+import pandas as pd
 
-data_copy['ref-idv-id'].fillna('N/A', inplace=True)
-data_copy['description'] = data_copy['description'].astype(str)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.parsing import readable_frame, typed_frame
+from common.sinks import read_table, write_frame
+from profiles import load_profiles, profile_names
+from schema import columns
 
-data_copy.loc[data_copy['mod-number'] == '0', 'total-obligated-amount'] = data_copy['obligated-amount']
+# one row per award and referenced IDV
+group_keys = ['award-id', 'ref-idv-id']
 
-grouped_data = data_copy.groupby(['award-id', 'ref-idv-id']).agg({
+# columns reduced natively per group, unlisted columns keep the value of the latest modification
+reductions = {
     'mod-number': 'count',
     'total-obligated-amount': 'last',
     'signed-date': 'first',
-    'description': lambda x: ', '.join(x.unique()),
-    **{col: lambda x: x.iloc[-1] for col in data.columns if col not in ['award-id', 'ref-idv-id',
-                                                                        'mod-number',
-                                                                        'signed-date',
-                                                                        'obligated-amount',
-                                                                        'total-obligated-amount',
-                                                                        'has-socio-data',
-                                                                        'other-government-entities',
-                                                                        'educational-entities',
-                                                                        'description']}
-}).reset_index()
-
-grouped_data.loc[grouped_data['ref-idv-id'] == 'N/A', 'ref-idv-id'] = ''
-
-grouped_data.to_excel('aggregate_sttr.xlsx', index=False)
+}
+
+# columns left out of the aggregate
+dropped_columns = ['obligated-amount', 'has-socio-data', 'other-government-entities', 'educational-entities']
+
+# unique key of a modification row in the crawler output
+row_key = 'url'
+
+# typed columns, amounts in integer cents
+amount_columns = ['obligated-amount', 'total-obligated-amount']
+date_columns = ['signed-date']
+
+
+def load_modifications(path):
+    """
+    Load a crawler output with typed amounts and dates, also when it is an export written before typed parsing.
+    """
+    return typed_frame(read_table(path), amounts=amount_columns, dates=date_columns)
+
+
+def export_xlsx(grouped_data, xlsx_file_path):
+    """
+    Export an aggregate to XLSX with amounts and dates formatted like fpds.gov shows them.
+    """
+    readable_frame(grouped_data, amounts=['total-obligated-amount'], dates=date_columns).to_excel(xlsx_file_path,
+                                                                                                index=False)
+
+
+def aggregate(data):
+    """
+    Aggregate contract modifications into one row per award.
+
+    Every rule is a native pandas reduction: count, last and first run per group in Cython, descriptions are
+    deduplicated before they are joined, and the remaining columns come from the last row of every group.
+    :param data: DataFrame of contract modifications, in crawl order
+    :return: DataFrame of awards, sorted by award ID and IDV
+    """
+    data = data.copy()
+    data['ref-idv-id'] = data['ref-idv-id'].fillna('N/A')
+    data['description'] = data['description'].astype(str)
+
+    data.loc[data['mod-number'] == '0', 'total-obligated-amount'] = data['obligated-amount']
+
+    grouped_data = data.groupby(group_keys).agg(reductions)
+
+    # unique descriptions of a group, in order of appearance
+    descriptions = data.drop_duplicates(group_keys + ['description'])
+    grouped_data['description'] = descriptions.groupby(group_keys)['description'].agg(', '.join)
+
+    last_columns = [col for col in data.columns
+                    if col not in group_keys + list(reductions) + dropped_columns + ['description']]
+    last_rows = data.drop_duplicates(group_keys, keep='last').set_index(group_keys)
+    grouped_data = grouped_data.join(last_rows[last_columns]).reset_index()
+
+    grouped_data.loc[grouped_data['ref-idv-id'] == 'N/A', 'ref-idv-id'] = ''
+    return grouped_data
+
+
+def group_index(data):
+    """
+    Group key of every row, with the same 'N/A' placeholder for a missing IDV as in aggregate().
+    """
+    ref_idv_ids = data['ref-idv-id'].replace('', pd.NA).fillna('N/A')
+    return pd.MultiIndex.from_arrays([data['award-id'], ref_idv_ids], names=group_keys)
+
+
+def upsert(data, delta):
+    """
+    Merge new or changed modification rows into the crawler output.
+
+    A row whose URL is already present replaces the old one in place, so the crawl order that first and last rely
+    on is kept, and new rows are appended.
+    :param data: DataFrame of contract modifications
+    :param delta: DataFrame of new or changed modifications
+    :return: updated DataFrame
+    """
+    delta = delta.drop_duplicates(row_key, keep='last').reindex(columns=data.columns)
+    changed = data[row_key].isin(delta[row_key])
+    # categorical columns read from Parquet would reject values they have not seen yet
+    data = data.astype({column: object for column in data.columns
+                        if isinstance(data[column].dtype, pd.CategoricalDtype)})
+    if changed.any():
+        data.loc[changed, :] = delta.set_index(row_key, drop=False).loc[data.loc[changed, row_key]].values
+    return pd.concat([data, delta[~delta[row_key].isin(data[row_key])]], ignore_index=True)
+
+
+def update_aggregate(delta, input_path, output_path, xlsx_file_path=None):
+    """
+    Apply a delta of modifications to an FPDS output file and its aggregate, recomputing only the affected groups.
+
+    The crawler output is the persisted state of every group: the delta rows are upserted into it, the groups they
+    touch are aggregated again from their rows, and every other row of the aggregate is kept as it is.
+    :param delta: DataFrame of new or changed modifications
+    :param input_path: crawler output, e.g. output_sttr.parquet, rewritten with the delta applied in the crawler schema
+    :param output_path: aggregate Parquet file, e.g. aggregate_sttr.parquet
+    :param xlsx_file_path: optional XLSX export of the aggregate
+    :return: DataFrame of awards
+    """
+    data = load_modifications(input_path)
+    delta = typed_frame(delta, amounts=amount_columns, dates=date_columns)
+    # a changed row may have moved to another group, its old group is affected too
+    affected = group_index(delta).union(group_index(data[data[row_key].isin(delta[row_key])])).unique()
+    data = upsert(data, delta)
+    # same typed, dictionary-encoded schema as the file the crawler writes
+    write_frame(data, os.path.splitext(input_path)[0] + '.parquet', columns)
+
+    if not os.path.exists(output_path):
+        grouped_data = aggregate(data)
+    else:
+        grouped_data = typed_frame(read_table(output_path), amounts=['total-obligated-amount'], dates=date_columns)
+        updated = aggregate(data[group_index(data).isin(affected)])
+        grouped_data = pd.concat([grouped_data[~group_index(grouped_data).isin(affected)], updated],
+                                 ignore_index=True)
+        # same order as the groupby of a full aggregation
+        order = group_index(grouped_data).to_frame(index=False).sort_values(group_keys, kind='stable').index
+        grouped_data = grouped_data.loc[order].reset_index(drop=True)
+
+    write_frame(grouped_data, output_path)
+    if xlsx_file_path:
+        export_xlsx(grouped_data, xlsx_file_path)
+    print(f'{len(delta)} modifications applied, {len(affected)} awards updated.')
+    return grouped_data
+
+
+def aggregate_file(input_path, output_path, xlsx_file_path=None):
+    """
+    Aggregate an FPDS output file.
+    :param input_path: crawler output, e.g. output_sttr.parquet
+    :param output_path: aggregate Parquet file, e.g. aggregate_sttr.parquet
+    :param xlsx_file_path: optional XLSX export of the aggregate
+    :return: DataFrame of awards
+    """
+    grouped_data = aggregate(load_modifications(input_path))
+
+    write_frame(grouped_data, output_path)
+    if xlsx_file_path:
+        export_xlsx(grouped_data, xlsx_file_path)
+    return grouped_data
+
+
+def xlsx_path(profile):
+    """
+    XLSX export of the aggregate of a profile, e.g. aggregate_sttr.xlsx.
+    """
+    return os.path.splitext(profile.aggregate_file_path)[0] + '.xlsx'
+
+
+def main(argv=None):
+    """
+    Command line entry point, also run by sbir_data.py fpds aggregate.
+
+    :param argv: command line arguments, sys.argv by default
+    """
+    parser = argparse.ArgumentParser(description="Aggregate FPDS contract modifications into one row per award")
+    parser.add_argument('programs', nargs='*',
+                        help=f"run profiles to aggregate ({', '.join(profile_names())}), all by default")
+    parser.add_argument('--xlsx', action='store_true', help="also export the aggregates to XLSX")
+    parser.add_argument('--delta', help="file of new or changed modifications to apply incrementally, "
+                                        "for a single program")
+    args = parser.parse_args(argv)
+    try:
+        profiles = load_profiles(args.programs)
+    except ValueError as exception:
+        parser.error(str(exception))
+    if args.delta:
+        if len(args.programs) != 1:
+            parser.error("--delta applies to exactly one program")
+        profile = profiles[0]
+        update_aggregate(read_table(args.delta), profile.parquet_file_path, profile.aggregate_file_path,
+                         xlsx_path(profile) if args.xlsx else None)
+        return
+    for profile in profiles:
+        if not os.path.exists(profile.parquet_file_path) and not os.path.exists(profile.xlsx_file_path):
+            print(f'No output file for {profile.name}, skipping.')
+            continue
+        aggregate_file(profile.parquet_file_path, profile.aggregate_file_path,
+                       xlsx_path(profile) if args.xlsx else None)
+        print(f'Aggregated {profile.name}.')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import asyncio
+import concurrent.futures
+import logging
+import sys
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+from tqdm import tqdm
+
+from contract import Contract
+from crawler import (BASE_URL, AWARD_QUERY, cache, detail_key, get_award_queries, get_page_url, get_page_urls,
+                     load_profiles, parse_award_ids, parse_result_total, parse_search_total, parse_view_links,
+                     write_parquet)
+from extractor import extract_contract
+from common.frontier import Frontier
+from common.http import RETRY_TOTAL, RETRY_STATUSES, backoff_delay
+from common.records import RecordBatch
+from common.throttle import get_throttle
+
+logger = logging.getLogger(__name__)
+
+# seconds to connect and between reads, time spent waiting for a free connection does not count
+TIME_OUT = 60
+
+# SQLite calls of the response cache block, so they run on this thread instead of the event loop
+# A single thread keeps them in order: an invalidated page is never served by a later lookup
+cache_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='cache')
+
+
+class AsyncCrawler:
+    """
+    Crawl pipeline on a single event loop: award ID discovery -> URL generation -> listing pages -> detail pages.
+
+    Every stage schedules the next one as soon as its own page is parsed, and all requests share one semaphore,
+    so the number of sockets is bounded globally instead of per thread pool. Requests also pass through the
+    per-host throttle of settings.ini, like the requests of the shared session.
+
+    :param session: aiohttp.ClientSession
+    :param semaphore: asyncio.Semaphore bounding the requests in flight, shared by every crawler of the session
+    :param search_query: search query relative to BASE_URL
+    """
+
+    def __init__(self, session, semaphore, search_query):
+        self.session = session
+        self.search_query = search_query
+        self.semaphore = semaphore
+        self.contracts = RecordBatch(Contract)
+        self.tasks = set()
+        self.seen_queries = set()
+        # detail links listed by several award queries are fetched once
+        self.frontier = Frontier(detail_key)
+        self.pbar = None
+
+    def spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def drain(self):
+        while self.tasks:
+            for result in await asyncio.gather(*list(self.tasks), return_exceptions=True):
+                if isinstance(result, Exception):
+                    logger.error(f"An unexpected error occurred: {result}")
+
+    def invalidate(self, url):
+        """
+        Drop a cached response without waiting for it, ordered before any later cache lookup.
+        """
+        cache_executor.submit(cache.invalidate, url)
+
+    async def fetch(self, url):
+        """
+        Fetch a page through the response cache.
+
+        :param url: URL to fetch
+        :return: response body as text, or None if every attempt failed
+        """
+        loop = asyncio.get_running_loop()
+        text = await loop.run_in_executor(cache_executor, cache.get, url)
+        if text is not None:
+            return text
+        throttle = get_throttle(urlsplit(url).hostname)
+        for attempt in range(RETRY_TOTAL):
+            retry_after = None
+            async with self.semaphore:
+                # the throttle blocks on locks and sleeps, so it is acquired off the event loop
+                await loop.run_in_executor(None, throttle.acquire)
+                ok = False
+                start = time.monotonic()
+                try:
+                    async with self.session.get(url) as resp:
+                        text = await resp.text()
+                        ok = resp.status not in RETRY_STATUSES
+                        if resp.status == 200:
+                            await loop.run_in_executor(cache_executor, cache.put, url, text)
+                        if ok:
+                            return text
+                        retry_after = resp.headers.get('Retry-After')
+                        logger.warning(f"Status {resp.status} while fetching {url} "
+                                       f"(Attempt {attempt + 1}/{RETRY_TOTAL})")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as exception:
+                    logger.warning(f"An error occurred while fetching {url}: {exception} "
+                                   f"(Attempt {attempt + 1}/{RETRY_TOTAL})")
+                finally:
+                    throttle.release(ok, time.monotonic() - start)
+            await asyncio.sleep(backoff_delay(attempt, retry_after))
+        logger.error(f"Giving up on {url} after {RETRY_TOTAL} attempts")
+        return None
+
+    async def crawl(self):
+        # the count probe is the first search page, parsed as such instead of being fetched twice
+        first_url = get_page_url(self.search_query, 0)
+        html = await self.fetch(first_url)
+        if html is None:
+            logger.error("Could not retrieve the search result page")
+            return self.contracts
+        urls = get_page_urls(self.search_query, parse_search_total(html))[1:]
+        logger.info(f"Searching for award ids")
+
+        self.pbar = tqdm(ncols=120, unit=' contracts')
+        results = [self.handle_search_page(first_url, html)]
+        results += await asyncio.gather(*(self.process_search_page(url) for url in urls))
+
+        # an award is only queried without IDV once discovery shows it has no referenced IDV at all
+        awards_with_idv = set()
+        award_ids = set()
+        for result_award_ids, result_idv_ids in results:
+            award_ids.update(result_award_ids)
+            awards_with_idv.update(result_idv_ids)
+        for award_id in award_ids - awards_with_idv:
+            self.spawn(self.process_query(AWARD_QUERY.format(award_id)))
+
+        await self.drain()
+        self.pbar.close()
+        return self.contracts
+
+    async def process_search_page(self, url):
+        html = await self.fetch(url)
+        if html is None:
+            return set(), {}
+        return self.handle_search_page(url, html)
+
+    def handle_search_page(self, url, html):
+        try:
+            award_ids, idv_ids = parse_award_ids(html)
+        except Exception as exception:
+            logger.error(f"An unexpected error occurred while processing search page {url}: {exception}")
+            self.invalidate(url)
+            return set(), {}
+        for award_id, idvs in idv_ids.items():
+            for query in get_award_queries(award_id, idvs):
+                self.spawn(self.process_query(query))
+        return award_ids, idv_ids
+
+    async def process_query(self, query):
+        if query in self.seen_queries:
+            return
+        self.seen_queries.add(query)
+        # the count probe is the first listing page
+        first_url = get_page_url(query, 0)
+        html = await self.fetch(first_url)
+        if html is None:
+            return
+        try:
+            total = parse_result_total(html)
+        except Exception as exception:
+            logger.error(f"Error processing query {query}: {exception}")
+            self.invalidate(first_url)
+            return
+        self.handle_listing(first_url, html)
+        for url in get_page_urls(query, total)[1:]:
+            self.spawn(self.process_listing(url))
+
+    async def process_listing(self, url):
+        html = await self.fetch(url)
+        if html is None:
+            logger.error(f"Skipping the contracts of listing page: {url}")
+            return
+        self.handle_listing(url, html)
+
+    def handle_listing(self, url, html):
+        links = parse_view_links(html)
+        if not links:
+            self.invalidate(url)
+        for link in self.frontier.filter(links):
+            self.spawn(self.process_detail(link))
+
+    async def process_detail(self, link):
+        for attempt in range(2):
+            html = await self.fetch(link)
+            if html is None:
+                logger.error(f"Could not retrieve contract: {link}")
+                return
+            contract = Contract()
+            contract.set_url(link)
+            extract_contract(html, contract)
+            if contract.award_id:
+                self.contracts.append(contract)
+                self.pbar.update(1)
+                return
+            logger.info(f"Empty value. Retrying for: {link}")
+            self.invalidate(link)
+        logger.error(f"Giving up on contract with empty award ID: {link}")
+
+
+def get_limit_per_host():
+    """
+    Maximum concurrency of the [throttle] settings of fpds.gov, used as the number of connections and of requests
+    in flight, so no request waits for a connection once it is sent.
+    """
+    return get_throttle(urlsplit(BASE_URL).hostname).controller.maximum
+
+
+async def run(search_queries, limit_per_host=None):
+    limit_per_host = limit_per_host or get_limit_per_host()
+    connector = aiohttp.TCPConnector(limit=limit_per_host, limit_per_host=limit_per_host)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=TIME_OUT, sock_read=TIME_OUT)
+    semaphore = asyncio.Semaphore(limit_per_host)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        return await asyncio.gather(*(AsyncCrawler(session, semaphore, search_query).crawl()
+                                      for search_query in search_queries))
+
+
+def async_crawl(profiles, limit_per_host=None):
+    """
+    Alternative to thread_crawl() on a single event loop with bounded global concurrency.
+    Every profile is crawled on the same loop, sharing one connection pool and one bound on requests in flight.
+
+    :param profiles: Profile objects to crawl
+    :param limit_per_host: maximum number of requests in flight and of open connections, across all profiles,
+        max_concurrency of the [throttle www.fpds.gov] settings by default
+    :return: List of RecordBatch of Contract objects, one per profile
+    """
+    results = asyncio.run(run([profile.search_query for profile in profiles], limit_per_host))
+    for profile, contracts in zip(profiles, results):
+        print(f'{profile.name} total contracts: ' + str(len(contracts)))
+    return results
+
+
+if __name__ == "__main__":
+    profiles = load_profiles(sys.argv[1:], frontier_key=detail_key)
+    for profile, contracts in zip(profiles, async_crawl(profiles)):
+        write_parquet(contracts, profile.parquet_file_path)
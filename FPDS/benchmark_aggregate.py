@@ -0,0 +1,68 @@
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.sinks import read_table
+
+from aggregate import aggregate
+
+
+def legacy_aggregate(data):
+    """
+    Previous aggregation with a Python lambda per column, kept as the reference for the benchmark.
+    """
+    data_copy = data.copy()
+
+    data_copy['ref-idv-id'].fillna('N/A', inplace=True)
+    data_copy['description'] = data_copy['description'].astype(str)
+
+    data_copy.loc[data_copy['mod-number'] == '0', 'total-obligated-amount'] = data_copy['obligated-amount']
+
+    grouped_data = data_copy.groupby(['award-id', 'ref-idv-id']).agg({
+        'mod-number': 'count',
+        'total-obligated-amount': 'last',
+        'signed-date': 'first',
+        'description': lambda x: ', '.join(x.unique()),
+        **{col: lambda x: x.iloc[-1] for col in data.columns if col not in ['award-id', 'ref-idv-id',
+                                                                            'mod-number',
+                                                                            'signed-date',
+                                                                            'obligated-amount',
+                                                                            'total-obligated-amount',
+                                                                            'has-socio-data',
+                                                                            'other-government-entities',
+                                                                            'educational-entities',
+                                                                            'description']}
+    }).reset_index()
+
+    grouped_data.loc[grouped_data['ref-idv-id'] == 'N/A', 'ref-idv-id'] = ''
+    return grouped_data
+
+
+def best_time(func, data, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(data)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the aggregation against the legacy per-column lambdas")
+    parser.add_argument('input_path', nargs='?', default='output_sbir.parquet',
+                        help="crawler output to aggregate, the full SBIR phase III dataset by default")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per implementation, the best one is reported")
+    args = parser.parse_args()
+
+    data = read_table(args.input_path)
+    legacy_time, expected = best_time(legacy_aggregate, data, args.repeat)
+    new_time, result = best_time(aggregate, data, args.repeat)
+
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+    print(f'{len(data)} modifications -> {len(result)} awards')
+    print(f'legacy: {legacy_time:.3f}s')
+    print(f'vectorized: {new_time:.3f}s ({legacy_time / new_time:.1f}x faster)')
@@ -1,4 +1,15 @@
+from datetime import date
+
+
 class Contract:
+    # no per-instance __dict__, records of a large crawl take a fraction of the memory
+    __slots__ = ('url', 'award_id', 'ref_idv_id', 'award_type', 'solicitation_id', 'mod_number', 'obligated_amount',
+                 'total_obligated_amount', 'signed_date', 'contracting_office_id', 'contracting_office',
+                 'funding_request_id', 'funding_request', 'legal_business_name', 'DBAN', 'city', 'state',
+                 'unique_entity_id', 'has_socio_data', 'business_type', 'socio_data', 'line_of_business',
+                 'relationship_with_government', 'other_government_entities', 'organization_factors',
+                 'educational_entities', 'certifications', 'description')
+
     def __init__(self):
         self.url = ""
         self.award_id = ""
@@ -6,9 +17,10 @@ class Contract:
         self.award_type = ""
         self.solicitation_id = ""
         self.mod_number = ""
-        self.obligated_amount = ""
-        self.total_obligated_amount = ""
-        self.signed_date = ""
+        # amounts in integer cents, signed date as a datetime.date
+        self.obligated_amount = None
+        self.total_obligated_amount = None
+        self.signed_date = None
         self.contracting_office_id = ""
         self.contracting_office = ""
         self.funding_request_id = ""
@@ -30,7 +42,20 @@ class Contract:
         self.description = ""
 
     def __str__(self):
-        return f"ContractInfo: {vars(self)}"
+        return f"ContractInfo: {self.to_dict()}"
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        contract = cls()
+        for field, value in data.items():
+            setattr(contract, field, value)
+        if isinstance(contract.signed_date, str):
+            # dates are stored as ISO text in JSON records
+            contract.signed_date = date.fromisoformat(contract.signed_date) if contract.signed_date else None
+        return contract
 
     def set_url(self, url):
         self.url = url
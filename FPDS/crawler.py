@@ -1,19 +1,35 @@
-import re
+import argparse
+import itertools
+import json
+import os
+import sys
+import threading
+from datetime import date, datetime, timedelta
+from urllib.parse import parse_qsl, urlsplit
 
 from bs4 import BeautifulSoup
 import requests
 from contract import Contract
+from extractor import extract_contract, extract_summaries
+from aggregate import update_aggregate
+from profiles import load_profiles, profile_names
+from schema import columns, output_columns
 import concurrent.futures
 from multiprocessing import Pool
 from tqdm import tqdm
-import csv
 import logging
-from openpyxl import Workbook
 from collections import defaultdict
-from line_profiler import LineProfiler
-import time
 from requests.exceptions import ReadTimeout
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import http
+from common.cache import load_cache
+from common.config import MAX_WORKERS
+from common.frontier import canonicalize_url
+from common.journal import DONE, FAILED
+from common.parsing import parse_date
+from common.sinks import read_table, write_records
+
 # set up logging
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO,
@@ -24,381 +40,321 @@ TOTAL_COUNT = 90
 
 BASE_URL = "https://www.fpds.gov"
 
-# output paths
-csv_file_path = "output_sttr.csv"
-xlsx_file_path = "output_sttr.xlsx"
+# award queries are filled with an award ID, search queries come from the run profiles in profiles.py
+AWARD_QUERY = "/ezsearch/fpdsportal?indexName=awardfull&templateName=1.5.3&s=FPDS.GOV&q=PIID%3A%22{}%22"
+IDV_FILTER = "+REF_IDV_PIID%3A%22{}%22"
+# date range filter of delta crawls, LAST_MOD_DATE:[from,to] with dates as YYYY/MM/DD
+DATE_FILTER = "+LAST_MOD_DATE%3A%5B{}%2C{}%5D"
+DATE_FORMAT = "%Y/%m/%d"
+# signed date filter of search shards, SIGNED_DATE:[from,to] with dates as YYYY/MM/DD
+SHARD_FILTER = "+SIGNED_DATE%3A%5B{}%2C{}%5D"
 
-# required fields
-fieldnames = ['url', 'solicitation_id', 'mod_number', 'award_id', 'ref_idv_id', 'award_type', 'obligated_amount',
-              'total_obligated_amount', 'signed_date', 'contracting_office_id', 'contracting_office',
-              'funding_request_id', 'funding_request', 'legal_business_name', 'DBAN', 'city', 'state',
-              'unique_entity_id', 'has_socio_data', 'business_type', 'socio_data', 'line_of_business',
-              'relationship_with_government', 'other_government_entities', 'organization_factors',
-              'educational_entities', 'certifications', 'description']
+# results per listing page, fixed by the ezsearch template
+PAGE_SIZE = 30
 
-# set up retry
-retry_attempts = 3
-retry_delay = 5
+# attempts at a listing page that comes back empty or fails, before it is left to a --resume run
+listing_attempts = 3
 
+# searches with more results are split into signed date shards, deep start offsets are slow to serve
+max_shard_results = 1500
+# first day covered by the shards, FPDS records start in fiscal year 1980
+shard_start_date = date(1979, 10, 1)
 
-def get_award_id(soup):
-    award_id_tag = soup.find('input', {'id': 'PIID'})
-    if award_id_tag:
-        award_id = award_id_tag['value']
-        return award_id
-    return ""
+# high-water mark of the last delta crawl per output file
+delta_state_path = "delta_state.json"
+# profiles run in parallel threads update the state file in turn
+delta_state_lock = threading.Lock()
+# days the date range reaches back before the high-water mark, modifications already stored are skipped anyway
+delta_overlap_days = 1
 
+# query parameters identifying the modification of a detail link, the same page can be linked with them in any order
+detail_key_params = ['agencyID', 'PIID', 'modNumber', 'idvAgencyID', 'idvPIID', 'transactionNumber']
 
-def get_idv_id(soup):
-    idv_id_tag = soup.find('input', {'id': 'idvPIID'})
-    if idv_id_tag:
-        idv_id = idv_id_tag['value']
-        return idv_id
-    return ""
+# response cache shared by every profile, so re-runs only download search listings and new detail pages
+cache = load_cache()
 
 
-def get_award_type(soup):
-    award_type_tag = soup.find('td', {'id': 'displayAwardType'})
-    if award_type_tag:
-        award_type = award_type_tag.text
-        return award_type
-    return ""
+def detail_key(url):
+    """
+    Deduplication key of a contract detail link, from the parameters that identify its modification.
+    Links of other pages are keyed by their canonical URL.
+    """
+    params = dict(parse_qsl(urlsplit(url).query, keep_blank_values=True))
+    if 'PIID' not in params:
+        return canonicalize_url(url)
+    return '|'.join(params.get(name, '') for name in detail_key_params)
 
 
-def get_solicitation_id(soup):
-    solicitation_tag = soup.find('input', {'id': 'solicitationID'})
-    if solicitation_tag:
-        solicitation_id = solicitation_tag['value']
-        return solicitation_id
-    return ""
+def parse_view_links(html):
+    """
+    Parse the contract detail links out of a contract list page.
 
+    :param html: HTML text of a contract list page
+    :return: List of contract detail URLs
+    """
+    search_soup = BeautifulSoup(html, 'html.parser')
+    view_tags = search_soup.find_all('a', {'title': 'View'})
+    hrefs = [a['href'] for a in view_tags]
+    links = []
+    for href in hrefs:
+        start_index = href.index("('/") + 2
+        end_index = href.index("')")
+        query = href[start_index:end_index]
+        links.append(BASE_URL + query)
+    return links
+
+
+def parse_award_ids(html):
+    """
+    Parse award IDs and IDV IDs out of a search result page.
 
-def get_mod_num(soup):
-    mod_tag = soup.find('input', {'id': 'modNumber'})
-    if mod_tag:
-        mod_number = mod_tag['value']
-        return mod_number
-    return ""
+    :param html: HTML text of a search result page
+    :return: Set of award IDs and dictionary of IDV IDs mapped to award IDs
+    """
+    award_ids = set()
+    idv_ids = defaultdict(set)
+    soup = BeautifulSoup(html, 'html.parser')
+    tables = soup.find_all('table', class_=['resultbox1', 'resultbox2'])
+    for table in tables:
+        award_id_tag = table.find('a', title=lambda value: value and 'Click here to drill down by Award ID' in value)
+        award_id = award_id_tag.text.strip()
+        referenced_idv_tag = table.find('a', title=lambda value: value and 'Click here to drill down by Referenced IDV' in value)
+        referenced_idv = referenced_idv_tag.text.strip()
+        award_ids.add(award_id)
+        if referenced_idv:
+            idv_ids[award_id].add(referenced_idv)
+    return award_ids, idv_ids
 
 
-def get_obligated_amount(soup):
-    obligated_amount_tag = soup.find('input', {'id': 'obligatedAmount'})
-    if obligated_amount_tag:
-        obligated_amount = obligated_amount_tag['value']
-        return obligated_amount
-    return ""
-
+def parse_search_total(html):
+    """
+    Parse the total number of results out of the first search result page.
+    """
+    start_page = BeautifulSoup(html, 'html.parser')
+    page_size_tag = start_page.find('b', string=str(PAGE_SIZE))
+    if page_size_tag is None:
+        # fewer results than one page, as is common for date-bounded delta queries
+        return len(start_page.find_all('table', class_=['resultbox1', 'resultbox2']))
+    total_tag = page_size_tag.find_next_sibling('b')
+    return int(total_tag.text)
 
-def get_total_obligated_amount(soup):
-    total_obligated_amount_tag = soup.find('input', {'id': 'totalObligatedAmount'})
-    if total_obligated_amount_tag and 'value' in total_obligated_amount_tag.attrs:
-        total_obligated_amount = total_obligated_amount_tag['value']
-        return total_obligated_amount
-    return "$0.00"
 
+def parse_result_total(html):
+    """
+    Parse the total number of results out of the first page of an award query.
+    """
+    start_page = BeautifulSoup(html, 'html.parser')
+    page_num_tag = start_page.find_all('span', class_='results_heading')[1]
+    total_page_tag = page_num_tag.find_all('b')[-1]
+    return int(total_page_tag.text)
 
-def get_signed_date(soup):
-    signed_date_tag = soup.find('input', {'id': 'signedDate'})
-    if signed_date_tag:
-        signed_date = signed_date_tag['value']
-        return signed_date
-    return ""
-
-
-def get_contracting_office_id(soup):
-    contracting_office_id_tag = soup.find('input', {'id': 'contractingOfficeAgencyID'})
-    if contracting_office_id_tag:
-        contracting_office_id = contracting_office_id_tag['value']
-        return contracting_office_id
-    return ""
-
-
-def get_contracting_office(soup):
-    contracting_office_tag = soup.find('input', {'id': 'contractingOfficeAgencyName'})
-    if contracting_office_tag:
-        contracting_office = contracting_office_tag['value']
-        return contracting_office
-    return ""
-
-
-def get_funding_request_id(soup):
-    funding_request_id_tag = soup.find('input', {'id': 'fundingRequestingAgencyID'})
-    if funding_request_id_tag:
-        funding_request_id = funding_request_id_tag['value']
-        return funding_request_id
-    return ""
-
-
-def get_funding_request(soup):
-    funding_request_tag = soup.find('input', {'id': 'fundingRequestingAgencyName'})
-    if funding_request_tag:
-        funding_request = funding_request_tag['value']
-        return funding_request
-    return ""
-
-
-def get_legal_business_name(soup):
-    vendor_name_tag = soup.find('input', {'id': 'vendorName'})
-    if vendor_name_tag:
-        vendor_name = vendor_name_tag['value']
-        return vendor_name
-    return ""
-
-
-def get_DBAN(soup):
-    DBAN_tag = soup.find('input', {'id': 'vendorDoingAsBusinessName'})
-    if DBAN_tag:
-        DBAN_name = DBAN_tag['value']
-        return DBAN_name
-    return ""
-
-
-def get_city(soup):
-    city_tag = soup.find('input', {'id': 'vendorCity'})
-    if city_tag:
-        city_name = city_tag['value']
-        return city_name
-    return ""
-
-
-def get_state(soup):
-    state_tag = soup.find('input', {'id': 'vendorState'})
-    if state_tag:
-        state_code = state_tag['value']
-        return state_code
-    return ""
-
-
-def get_unique_entity_id(soup):
-    UEI_tag = soup.find('input', {'id': 'UEINumber'})
-    if UEI_tag:
-        UEI_number = UEI_tag['value']
-        return UEI_number
-    return ""
-
-
-def get_checked_categories(tr):
-    # for contracts after 2010, the page uses checkbox for various categories
-    categories = []
-    checkboxes = tr.find_all('input', {'type': 'checkbox'})
-    for checkbox in checkboxes:
-        category_name = checkbox.find_next('td').text.strip()
-        is_checked = checkbox.get('checked') == 'true'
-        if is_checked:
-            categories.append(category_name)
-    return ",".join(categories)
-
-
-def get_business_type(soup):
-    business_type_tr = soup.find('tr', id='busTypestr')
-    return get_checked_categories(business_type_tr)
-
-
-def get_socio_data(soup, has_socio_data):
-    categories = []
-    # for contracts before 2010
-    if has_socio_data:
-        sentinal = soup.find('tr', id='ccrVersion')
-        if sentinal:
-            tr = sentinal.find_next_sibling('tr')
-            td = tr.find_all('td')[0]
-            socio_data_td = td.findNext('td').find_next_sibling('td')
-            checkboxes = socio_data_td.find_all('input', {'type': 'checkbox'})
-            for checkbox in checkboxes:
-                category_name = checkbox.find_next('td').get_text(strip=True)
-                is_checked = checkbox.get('checked') == 'true'
-                if is_checked:
-                    categories.append(category_name)
-    # for contracts after 2010
-    else:
-        socio_data_tr = soup.find('tr', id='sociotr')
-        checkboxes = socio_data_tr.find_all('input', {'type': 'checkbox'})
-        for checkbox in checkboxes:
-            category_name = checkbox.find_next('td').text.strip()
-            is_checked = checkbox.get('checked') == 'true'
-            if is_checked:
-                categories.append(category_name)
-    return ",".join(categories)
+
+def get_page_url(query, page):
+    """
+    URL of one listing page of a query. The first page is also the count probe, so both share a cache entry.
+    """
+    return BASE_URL + query + "&start=" + str(page * PAGE_SIZE)
 
 
-def get_line_of_business(soup):
-    line_of_business_tr = soup.find('tr', id='lobtr')
-    return get_checked_categories(line_of_business_tr)
+def get_page_urls(query, total):
+    """
+    Generate the URLs of every listing page for a query.
 
+    :param query: search query relative to BASE_URL
+    :param total: total number of results of the query
+    :return: List of listing page URLs
+    """
+    return [get_page_url(query, i) for i in range(total // PAGE_SIZE + 1)]
 
-def get_relationship_with_government(soup):
-    relationship_with_government_tr = soup.find('tr', id='relWithFedGovtr')
-    return get_checked_categories(relationship_with_government_tr)
 
+def split_date_range(start, end):
+    """
+    Split a date range in two, at the fiscal year boundary closest to its middle if it contains one.
 
-def get_other_government_entities(soup):
-    other_government_entities_tr = soup.find('tr', id='otherGovEnttr')
-    return get_checked_categories(other_government_entities_tr)
+    :return: two disjoint (start, end) ranges covering the given one
+    """
+    middle = start + (end - start) // 2
+    fiscal_year = date(middle.year if middle.month >= 10 else middle.year - 1, 10, 1)
+    boundaries = [day for day in (fiscal_year, fiscal_year.replace(year=fiscal_year.year + 1)) if start < day <= end]
+    split = min(boundaries, key=lambda day: abs(day - middle)) if boundaries else middle + timedelta(days=1)
+    return (start, split - timedelta(days=1)), (split, end)
 
 
-def get_organization_factors(soup):
-    organization_factors_tr = soup.find('tr', id='orgFactorstr')
-    return get_checked_categories(organization_factors_tr)
+def get_shard_query(search_query, start, end):
+    return search_query + SHARD_FILTER.format(start.strftime(DATE_FORMAT), end.strftime(DATE_FORMAT))
 
 
-def get_educational_entities(soup):
-    educational_entities_tr = soup.find('tr', id='eduEnttr')
-    return get_checked_categories(educational_entities_tr)
+def partition_search(search_query, workers=MAX_WORKERS):
+    """
+    Split a search into disjoint signed date shards of at most max_shard_results results each.
 
+    The whole search is probed first, and a search over the limit is bisected recursively along fiscal years, then
+    days. Each level of shards is probed in parallel. The probe of a shard is its first listing page, so it is
+    kept and not requested again.
 
-def get_certifications(soup):
-    certifications_tr = soup.find('tr', id='certtr')
-    return get_checked_categories(certifications_tr)
+    :param search_query: search query relative to BASE_URL
+    :param workers: threads probing the shards of a level
+    :return: List of (shard query, total, HTML of the first page) tuples
+    """
+    html = cache.fetch(get_page_url(search_query, 0), timeout=60)
+    total = parse_search_total(html)
+    if total <= max_shard_results:
+        return [(search_query, total, html)]
+
+    shards = []
+    pending = [(shard_start_date, date.today())]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending:
+            queries = [get_shard_query(search_query, start, end) for start, end in pending]
+            pages = executor.map(lambda query: cache.fetch(get_page_url(query, 0), timeout=60), queries)
+            split = []
+            for (start, end), query, page in zip(pending, queries, pages):
+                shard_total = parse_search_total(page)
+                if shard_total > max_shard_results and start < end:
+                    split += split_date_range(start, end)
+                else:
+                    shards.append((query, shard_total, page))
+            pending = split
+    found = sum(shard_total for _, shard_total, _ in shards)
+    if found < total:
+        logger.warning(f"Signed date shards hold {found} of {total} results")
+    logger.info(f"{total} results split into {len(shards)} shards")
+    return shards
 
 
-def get_description(soup):
-    textarea = soup.find('textarea', {'id': 'descriptionOfContractRequirement'})
-    if textarea:
-        description = textarea.text.strip()
-        return description
-    return ""
+def get_award_queries(award_id, idv_ids, date_filter=''):
+    """
+    Generate the award queries for an award ID, one per referenced IDV.
+
+    :param award_id: Award ID
+    :param idv_ids: IDV IDs referenced by the award
+    :param date_filter: optional DATE_FILTER restricting the queries to recently modified records
+    :return: List of queries relative to BASE_URL
+    """
+    search = AWARD_QUERY.format(award_id)
+    if not idv_ids:
+        return [search + date_filter]
+    return [search + IDV_FILTER.format(idv_id) + date_filter for idv_id in idv_ids]
 
 
 def process_contract(link):
     """
     Process a contract given its URL and retrieve the contract information.
-    Generate a BeautifulSoup object and calls get_{fieldname}().
+    The detail page is parsed in a single streaming pass by extract_contract().
+    Transient network errors are retried with backoff by the shared session.
 
     :param link: URL of the contract
     :return: Contract object containing the contract information
     """
-    for attempt in range(retry_attempts):
-        try:
-            contract = Contract()
-            contract.set_url(link)
-            # logger.info(f"Processing link under url: {link}")
-            contract_res = requests.get(link, timeout=60)
-            contract_soup = BeautifulSoup(contract_res.text, 'html.parser')
-
-            contract.set_award_id(get_award_id(contract_soup))
-            contract.set_ref_idv_id(get_idv_id(contract_soup))
-            contract.set_award_type(get_award_type(contract_soup))
-
-            contract.set_solicidation_id(get_solicitation_id(contract_soup))
-            contract.set_mod_number(get_mod_num(contract_soup))
-
-            contract.set_obligated_amount(get_obligated_amount(contract_soup))
-            contract.set_total_obligated_amount(get_total_obligated_amount(contract_soup))
-            contract.set_signed_date(get_signed_date(contract_soup))
-
-            contract.set_contracting_office_id(get_contracting_office_id(contract_soup))
-            contract.set_contracting_office(get_contracting_office(contract_soup))
-
-            contract.set_funding_request_id(get_funding_request_id(contract_soup))
-            contract.set_funding_request(get_funding_request(contract_soup))
-
-            contract.set_legal_business_name(get_legal_business_name(contract_soup))
-            contract.set_DBAN(get_DBAN(contract_soup))
-
-            contract.set_city(get_city(contract_soup))
-            contract.set_state(get_state(contract_soup))
-
-            contract.set_unique_entity_id(get_unique_entity_id(contract_soup))
+    try:
+        contract = Contract()
+        contract.set_url(link)
+        # logger.info(f"Processing link under url: {link}")
+        extract_contract(cache.fetch(link, timeout=60), contract)
+        if not contract.award_id:
+            # do not keep serving an incomplete page from the cache
+            cache.invalidate(link)
 
-            socio_data_tag = contract_soup.find('tr', {'id': 'vendorDetails'})
-            if socio_data_tag and 'style' in socio_data_tag.attrs:
-                if 'display:none' in socio_data_tag['style']:
-                    contract.toggle_has_socio_data()
+        return contract
 
-            if not contract.has_socio_data:
-                contract.set_business_type(get_business_type(contract_soup))
-                contract.set_line_of_business(get_line_of_business(contract_soup))
-                contract.set_relationship_with_government(get_relationship_with_government(contract_soup))
-                contract.set_other_government_entities(get_other_government_entities(contract_soup))
-                contract.set_organization_factors(get_organization_factors(contract_soup))
-                contract.set_educational_entities(get_educational_entities(contract_soup))
-                contract.set_certifications(get_certifications(contract_soup))
-            contract.set_socio_data(get_socio_data(contract_soup, contract.has_socio_data))
+    except requests.exceptions.RequestException as exception:
+        print(f"An error occurred while processing contract from {link}: {exception}")
 
-            contract.set_description(get_description(contract_soup))
+    except Exception as exception:
+        print(f"An unexpected error occurred while processing contract from {link}: {exception}")
 
-            # if not contract.award_id:
-            #     raise ValueError("Empty award ID.")
+    return None
 
-            return contract
 
-        except requests.exceptions.RequestException as exception:
-            print(f"An error occurred while processing contract from {link}: {exception}")
-            time.sleep(retry_delay)
-            print(f"Request timed out. Retrying... (Attempt {attempt + 1}/{retry_attempts})")
+def get_listing_links(url, links=None):
+    """
+    Retrieve the contract detail links of a contract list page, unless they were parsed from its count probe.
 
-        # except ValueError as exception:
-        #     print(f"An error occurred while processing contract from {link}: {exception}")
-        #     time.sleep(retry_delay)
-        #     print(f"Empty value. Retrying... (Attempt {attempt + 1}/{retry_attempts})")
+    Listing pages of a query always hold results, so a page without links is an error page. It is dropped from the
+    cache and fetched again, up to listing_attempts times, like a page that fails to download or parse.
 
+    :return: List of contract detail URLs, empty if every attempt failed
+    """
+    if links:
+        return links
+    for attempt in range(listing_attempts):
+        try:
+            links = parse_view_links(cache.fetch(url, timeout=60))
+            if links:
+                return links
+            logger.warning(f"No contract links on listing page {url} (Attempt {attempt + 1}/{listing_attempts})")
         except Exception as exception:
-            print(f"An unexpected error occurred while processing contract from {link}: {exception}")
-            time.sleep(retry_delay)
-            print(f"Unexpected error. Retrying... (Attempt {attempt + 1}/{retry_attempts})")
-
-    return None
+            logger.warning(f"An error occurred while processing listing page {url}: {exception} "
+                           f"(Attempt {attempt + 1}/{listing_attempts})")
+        cache.invalidate(url)
+    return []
 
 
-# @profile
-def get_contract_info_for_30(url):
+def get_contract_info_for_30(url, profile, links=None):
     """
     Process all contracts on one page by calling process_contract().
 
     :param url: URL of a contract list page
+    :param profile: Profile of the crawl, holding its journal and frontier
+    :param links: contract links of the page if it was already parsed as the count probe of its query
     :return: List of Contract objects
     """
+    journal = profile.journal
     # logger.info(f"Processing url: {url}")
-    for attempt in range(retry_attempts):
-        try:
-            # Retrieve the target url links for the 30 contracts
-            session = requests.Session()
-            search_res = session.get(url, timeout=60)
-            search_soup = BeautifulSoup(search_res.text, 'html.parser')
-            view_tags = search_soup.find_all('a', {'title': 'View'})
-            hrefs = [a['href'] for a in view_tags]
-            links = []
-            for href in hrefs:
-                start_index = href.index("('/") + 2
-                end_index = href.index("')")
-                query = href[start_index:end_index]
-                links.append(BASE_URL + query)
-
-            contracts = []
-            retry_links = []
-            # Parse the required fields in contract detail
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                results = executor.map(process_contract, links)
-                for result in results:
-                    if result.award_id:
-                        contracts.append(result)
-                    else:
-                        retry_links.append(result.url)
-
-            retry_contracts = []
-            while retry_links:
-                link = retry_links.pop()
-                logger.info(f"Empty value. Retrying for: {link}")
-                retry_contract = process_contract(link)
-                if retry_contract.award_id:
-                    retry_contracts.append(retry_contract)
+    try:
+        # Retrieve the target url links for the 30 contracts
+        links = get_listing_links(url, links)
+        if not links:
+            logger.error(f"Could not retrieve listing page, leaving it to --resume: {url}")
+            journal.mark('listing', url, FAILED)
+            return []
+        # links listed by another page as well are fetched once, by whichever page claims them first
+        links = profile.frontier.filter(links)
+        # contracts finished by an earlier run are reloaded from the journal
+        links = [link for link in links if journal.status('detail', link) != DONE]
+        journal.add('detail', links)
+
+        contracts = []
+        retry_links = []
+        failed_links = []
+        # Parse the required fields in contract detail
+        with concurrent.futures.ThreadPoolExecutor(max_workers=profile.max_workers) as executor:
+            results = executor.map(process_contract, links)
+            for link, result in zip(links, results):
+                if result is None:
+                    failed_links.append(link)
+                elif result.award_id:
+                    contracts.append(result)
                 else:
-                    retry_contracts.append(link)
+                    retry_links.append(link)
+
+        retry_contracts = []
+        while retry_links:
+            link = retry_links.pop()
+            logger.info(f"Empty value. Retrying for: {link}")
+            retry_contract = process_contract(link)
+            if retry_contract and retry_contract.award_id:
+                retry_contracts.append(retry_contract)
+            else:
+                failed_links.append(link)
 
-            contracts += retry_contracts
+        contracts += retry_contracts
 
-            return contracts
+        for contract in contracts:
+            journal.mark('detail', contract.url, DONE, contract.to_dict())
+        for link in failed_links:
+            journal.mark('detail', link, FAILED)
+        # a listing with failed details stays failed, so --resume fetches them again
+        journal.mark('listing', url, FAILED if failed_links else DONE)
+        return contracts
 
-        except requests.exceptions.RequestException as exception:
-            print(f"An error occurred while processing batch from {url}: {exception}")
-            time.sleep(retry_delay)
-            print(f"Request timed out. Retrying... (Attempt {attempt + 1}/{retry_attempts})")
+    except requests.exceptions.RequestException as exception:
+        print(f"An error occurred while processing batch from {url}: {exception}")
 
-        except Exception as exception:
-            print(f"An unexpected error occurred while processing batch from {url}: {exception}")
-            time.sleep(retry_delay)
-            print(f"Unexpected error. Retrying... (Attempt {attempt + 1}/{retry_attempts})")
+    except Exception as exception:
+        print(f"An unexpected error occurred while processing batch from {url}: {exception}")
 
+    journal.mark('listing', url, FAILED)
     return []
 
 
@@ -409,42 +365,27 @@ def process_page_for_award_id(url):
     :param url: URL of the page to process
     :return: Set of award IDs and dictionary of IDV IDs mapped to award IDs
     """
-    award_ids = set()
-    idv_ids = defaultdict(set)
-    session = requests.Session()
-    search_res = session.get(url, timeout=60)
-    soup = BeautifulSoup(search_res.text, 'html.parser')
-    tables = soup.find_all('table', class_=['resultbox1', 'resultbox2'])
-    for table in tables:
-        award_id_tag = table.find('a', title=lambda value: value and 'Click here to drill down by Award ID' in value)
-        award_id = award_id_tag.text.strip()
-        referenced_idv_tag = table.find('a', title=lambda value: value and 'Click here to drill down by Referenced IDV' in value)
-        referenced_idv = referenced_idv_tag.text.strip()
-        award_ids.add(award_id)
-        if referenced_idv:
-            idv_ids[award_id].add(referenced_idv)
-    return award_ids, idv_ids
+    return parse_award_ids(cache.fetch(url, timeout=60))
 
 
-def get_award_ids():
+def get_award_ids(search_query, workers=MAX_WORKERS):
     """
     Retrieve the target set of award IDs and IDV IDs.
+    The search is partitioned into shards, and the remaining pages of every shard are fetched in parallel.
 
+    :param search_query: search query relative to BASE_URL
+    :param workers: threads probing the shards
     :return: Set of award IDs and dictionary of IDV IDs mapped to award IDs
     """
     award_ids = set()
     idv_ids = defaultdict(set)
-    search_query = "/ezsearch/search.do?indexName=awardfull&templateName=1.5.3&s=FPDS.GOV&q=sttr+phase+iii"
-    resp = requests.get(BASE_URL + search_query, timeout=60)
-    start_page = BeautifulSoup(resp.text, 'html.parser')
-    total_tag = start_page.find('b', string='30').find_next_sibling('b')
-    total = int(total_tag.text)
-    # total = 0
-    urls = [BASE_URL + search_query + "&start=" + str(i * 30) for i in range(total // 30 + 1)]
+    shards = partition_search(search_query, workers)
+    first_pages = [parse_award_ids(html) for _, _, html in shards]
+    urls = [url for query, total, _ in shards for url in get_page_urls(query, total)[1:]]
     logger.info(f"Searching for award ids")
-    with concurrent.futures.ThreadPoolExecutor() as executor, tqdm(total=len(urls), ncols=120) as pbar:
+    with concurrent.futures.ThreadPoolExecutor() as executor, tqdm(total=len(shards) + len(urls), ncols=120) as pbar:
         results = executor.map(process_page_for_award_id, urls)
-        for result in results:
+        for result in itertools.chain(first_pages, results):
             result_award_ids, result_idv_ids = result
             award_ids.update(result_award_ids)
             for award_id, idvs in result_idv_ids.items():
@@ -453,95 +394,274 @@ def get_award_ids():
     return award_ids, idv_ids
 
 
-def process_award_id(award_id, idv_ids):
+def process_award_id(award_id, idv_ids, date_filter='', parse=parse_view_links):
     """
     Process an award ID and its associated IDV IDs to generate URLs for contract processing.
 
+    The count probe of each award query is its first listing page. It is parsed with `parse` right away and
+    handed on with the URLs, so the page is not requested again.
+
     :param award_id: Award ID to process
     :param idv_ids: Dictionary of IDV IDs mapped to the award ID
-    :return: List of URLs to process
+    :param date_filter: optional DATE_FILTER restricting the queries to recently modified records
+    :param parse: function parsing the HTML of a probe the way its listing page is processed
+    :return: List of URLs to process, and dictionary of the first page URL of every query to its parsed probe
     """
     urls = []
-    queries = []
-    search = "/ezsearch/fpdsportal?indexName=awardfull&templateName=1.5.3&s=FPDS.GOV&q=PIID%3A%22{}%22".format(award_id)
-    if not idv_ids[award_id]:
-        queries.append(search)
-    while idv_ids[award_id]:
-        idv_id = idv_ids[award_id].pop()
-        queries.append(search + "+REF_IDV_PIID%3A%22{}%22".format(idv_id))
-    for query in queries:
-        resp = requests.get(BASE_URL + query, timeout=60)
-        start_page = BeautifulSoup(resp.text, 'html.parser')
-        page_num_tag = start_page.find_all('span', class_='results_heading')[1]
-        total_page_tag = page_num_tag.find_all('b')[-1]
-        total = int(total_page_tag.text)
-        urls += [BASE_URL + query + "&start=" + str(i * 30) for i in range(total // 30 + 1)]
+    probes = {}
+    for query in get_award_queries(award_id, idv_ids[award_id], date_filter):
+        first_url = get_page_url(query, 0)
+        html = cache.fetch(first_url, timeout=60)
+        total = parse_result_total(html)
+        urls += get_page_urls(query, total)
+        try:
+            probes[first_url] = parse(html)
+        except Exception as exception:
+            # the listing page is fetched again when it is processed
+            logger.warning(f"Could not parse the first listing page {first_url}: {exception}")
     # if len(urls) > 50:
     #     print("{}: {}, link: {}".format(award_id, len(urls), BASE_URL + search_query))
-    return urls
+    return urls, probes
 
 
-def get_target_urls():
+def get_target_urls(profile, date_filter='', parse=parse_view_links):
     """
     Retrieve the target URLs for contract processing.
 
-    :return: List of target URLs
+    :param profile: Profile whose search is crawled
+    :param date_filter: optional DATE_FILTER, to only list the records modified in a date range
+    :param parse: function parsing the first listing page of every award query, see process_award_id()
+    :return: List of target URLs, and dictionary of first page URLs to their parsed content
     """
-    award_ids, idv_ids = get_award_ids()
+    award_ids, idv_ids = get_award_ids(profile.search_query + date_filter, profile.max_workers)
     # award_ids.add("0060")
     urls = []
+    probes = {}
     logger.info(f"Generating urls")
     with concurrent.futures.ThreadPoolExecutor() as executor, tqdm(total=len(award_ids), ncols=160) as pbar:
-        future_to_url = {executor.submit(process_award_id, award_id, idv_ids): award_id for award_id in award_ids}
+        future_to_url = {executor.submit(process_award_id, award_id, idv_ids, date_filter, parse): award_id
+                         for award_id in award_ids}
         for future in concurrent.futures.as_completed(future_to_url):
             award_id = future_to_url[future]
             try:
-                urls.extend(future.result())
+                award_urls, award_probes = future.result()
+                urls.extend(award_urls)
+                probes.update(award_probes)
             except Exception as exception:
                 print(f"Error processing award ID {award_id}: {exception}")
             pbar.update(1)
-    return urls
+    return urls, probes
 
 
-def thread_crawl():
+def thread_crawl(profile, resume=False):
     """
     Perform threaded crawling to retrieve contract information.
+    Every listing and detail URL is recorded in the journal of the profile together with its parsed contract.
 
     Note: Speed depends on network and core number. Usually finishes in 2-3 hours.
 
+    :param profile: Profile to crawl
+    :param resume: continue the journaled run, only pending or failed listing pages are crawled again
     :return: List of Contract objects
     """
-    urls = get_target_urls()
-    contracts = []
+    journal = profile.journal
+    if not resume:
+        journal.clear()
+    urls = journal.keys('listing')
+    # contract links of the count probes, a resumed run fetches its listing pages again
+    probes = {}
+    if urls:
+        logger.info(f"Resuming with {len(journal.keys('listing', DONE))}/{len(urls)} listing pages done")
+    else:
+        urls, probes = get_target_urls(profile)
+        journal.add('listing', urls)
+    urls = [url for url in urls if journal.status('listing', url) != DONE]
+    contracts = [Contract.from_dict(record) for _, record in journal.records('detail')]
+    profile.frontier.clear(contract.url for contract in contracts)
     logger.info(f"Processing url for contract info")
-    with concurrent.futures.ThreadPoolExecutor() as executor:
+    with concurrent.futures.ThreadPoolExecutor(max_workers=profile.max_workers) as executor:
         # Submit tasks for each URL
-        future_contracts = [executor.submit(get_contract_info_for_30, url) for url in urls]
+        future_contracts = [executor.submit(get_contract_info_for_30, url, profile, probes.pop(url, None))
+                            for url in urls]
 
         # Retrieve the completed contracts with progress bar
-        with tqdm(total=len(future_contracts), ncols=200) as pbar:
+        with tqdm(total=len(future_contracts), desc=profile.name, ncols=200) as pbar:
             for future in concurrent.futures.as_completed(future_contracts):
                 contracts += future.result()
                 pbar.update(1)
 
     # for contract in contracts:
     #     print(contract)
-    print('total contracts: ' + str(len(contracts)))
+    print(f'{profile.name} total contracts: ' + str(len(contracts)))
+    return contracts
+
+
+def get_summaries_for_30(url, frontier, contracts=None):
+    """
+    Build partial contracts from the result boxes of one listing page, without fetching the detail pages.
+
+    :param url: URL of a contract list page
+    :param frontier: Frontier of the crawl, contracts already summarized are skipped
+    :param contracts: summaries of the page if it was already parsed as the count probe of its query
+    :return: List of Contract objects
+    """
+    try:
+        contracts = contracts or extract_summaries(cache.fetch(url, timeout=60), BASE_URL)
+        if not contracts:
+            cache.invalidate(url)
+        return [contract for contract in contracts if frontier.add(contract.url)]
+
+    except requests.exceptions.RequestException as exception:
+        print(f"An error occurred while processing batch from {url}: {exception}")
+
+    except Exception as exception:
+        print(f"An unexpected error occurred while processing batch from {url}: {exception}")
+
+    return []
+
+
+def summary_crawl(profile):
+    """
+    Crawl the listing pages only and summarize every modification from its result box.
+
+    One request per 30 modifications instead of 31. Socio data, business categories, certifications and the
+    description are left empty; enrich_summaries() fills them in later from the detail pages.
+
+    :param profile: Profile to crawl
+    :return: List of partial Contract objects
+    """
+    urls, probes = get_target_urls(profile, parse=lambda html: extract_summaries(html, BASE_URL))
+    profile.frontier.clear()
+    logger.info(f"Summarizing listing pages")
+    contracts = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=profile.max_workers) as executor:
+        summaries = executor.map(lambda url: get_summaries_for_30(url, profile.frontier, probes.get(url)), urls)
+        for page_contracts in tqdm(summaries, total=len(urls), desc=profile.name, ncols=120):
+            contracts += page_contracts
+
+    print(f'{profile.name} total summaries: ' + str(len(contracts)))
+    return contracts
+
+
+def enrich_summaries(profile):
+    """
+    Deferred enrichment pass of a summary crawl: fetch the detail page of every summarized modification.
+
+    Listing pages are not requested again, and detail pages already fetched by an earlier run come from the cache.
+
+    :param profile: Profile whose summary file is enriched
+    :return: List of complete Contract objects
+    """
+    profile.frontier.clear()
+    links = profile.frontier.filter(read_table(profile.summary_file_path, columns=['url'])['url'])
+    logger.info(f"Enriching {len(links)} summaries")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=profile.max_workers) as executor:
+        contracts = [contract for contract in tqdm(executor.map(process_new_contract, links), total=len(links),
+                                                   desc=profile.name, ncols=120)
+                     if contract is not None]
+
+    print(f'{profile.name} total contracts: ' + str(len(contracts)))
     return contracts
 
 
-def process_crawl():
+def load_high_water_mark(profile):
+    """
+    Date up to which the output file of a profile is known to be complete.
+
+    Read from the delta state file, or taken from the latest signed date in the output file before the first delta
+    crawl.
+
+    :return: date, or None if there is no output file yet
+    """
+    if os.path.exists(delta_state_path):
+        with open(delta_state_path) as f:
+            state = json.load(f)
+        if profile.parquet_file_path in state:
+            return datetime.strptime(state[profile.parquet_file_path], DATE_FORMAT).date()
+    if not os.path.exists(profile.parquet_file_path) and not os.path.exists(profile.xlsx_file_path):
+        return None
+    signed_dates = read_table(profile.parquet_file_path, columns=['signed-date'])['signed-date'].map(parse_date).dropna()
+    return signed_dates.max() if len(signed_dates) else None
+
+
+def save_high_water_mark(profile, mark):
+    """
+    Store the high-water mark of a profile. The state file is replaced atomically, so an interrupted write never
+    leaves it corrupt.
+    """
+    with delta_state_lock:
+        state = {}
+        if os.path.exists(delta_state_path):
+            with open(delta_state_path) as f:
+                state = json.load(f)
+        state[profile.parquet_file_path] = mark.strftime(DATE_FORMAT)
+        temp_path = delta_state_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(temp_path, delta_state_path)
+
+
+def process_new_contract(link):
+    """
+    Process a contract, retrying once if its page came back without an award ID.
+    """
+    contract = process_contract(link)
+    if contract is not None and not contract.award_id:
+        logger.info(f"Empty value. Retrying for: {link}")
+        contract = process_contract(link)
+    if contract is None or not contract.award_id:
+        logger.error(f"Could not retrieve contract: {link}")
+        return None
+    return contract
+
+
+def delta_crawl(profile, since=None, until=None):
+    """
+    Crawl only the modifications made since the last run.
+
+    The search and award queries are bounded by a LAST_MOD_DATE range starting at the high-water mark, and detail
+    pages are only fetched for modifications that are not in the output file yet.
+
+    :param profile: Profile to update
+    :param since: start of the date range, defaults to the stored high-water mark
+    :param until: end of the date range, defaults to today
+    :return: List of new Contract objects and the end of the date range, the next high-water mark
+    """
+    since = since or load_high_water_mark(profile)
+    if since is None:
+        raise ValueError(f"No {profile.parquet_file_path} to update, run a full crawl first")
+    until = until or date.today()
+    date_filter = DATE_FILTER.format((since - timedelta(days=delta_overlap_days)).strftime(DATE_FORMAT),
+                                     until.strftime(DATE_FORMAT))
+    logger.info(f"Crawling modifications from {since} to {until}")
+
+    # modifications already stored count as seen
+    profile.frontier.clear(read_table(profile.parquet_file_path, columns=['url'])['url'])
+    urls, probes = get_target_urls(profile, date_filter)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=profile.max_workers) as executor:
+        links = []
+        for page_links in executor.map(lambda url: get_listing_links(url, probes.get(url)), urls):
+            links += profile.frontier.filter(page_links)
+        logger.info(f"{len(links)} new modifications")
+        contracts = [contract for contract in tqdm(executor.map(process_new_contract, links), total=len(links),
+                                                   desc=profile.name, ncols=120)
+                     if contract is not None]
+
+    print(f'{profile.name} new contracts: ' + str(len(contracts)))
+    return contracts, until
+
+
+def process_crawl(profile):
     """
     Legacy function. Please use thread_crawl instead.
 
     Note: process pool performs well on small sample, while thread pool is significantly better on large data.
     """
-    search_query = "/ezsearch/search.do?indexName=awardfull&templateName=1.5.3&s=FPDS.GOV&q=sbir+phase+iii"
     # Loop over all search results
-    urls = [BASE_URL + search_query + "&start=" + str(i * 30) for i in range(TOTAL_COUNT // 30 + 1)]
+    urls = [BASE_URL + profile.search_query + "&start=" + str(i * 30) for i in range(TOTAL_COUNT // 30 + 1)]
     contracts = []
     pool = Pool(processes=8)
-    future_contracts = pool.starmap(get_contract_info_for_30, [(url,) for url in urls])
+    future_contracts = pool.starmap(get_contract_info_for_30, [(url, profile) for url in urls])
 
     for result in future_contracts:
         contracts += result
@@ -550,82 +670,127 @@ def process_crawl():
     return contracts
 
 
-def write_csv(contracts):
+def write_csv(contracts, csv_file_path):
     """
     Write contracts to a CSV file.
     :param contracts:
+    :param csv_file_path: e.g. the csv_file_path of a profile
     :return: output.csv
     """
-    with open(csv_file_path, 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+    csv_columns, converters = output_columns(csv_file_path)
+    write_records(contracts, csv_file_path, csv_columns, converters=converters)
 
-        # Write the header row
-        writer.writeheader()
+    print('CSV file has been generated.')
 
-        # Write the contract data
-        for contract in contracts:
-            writer.writerow(vars(contract))
 
-    print('CSV file has been generated.')
+def write_parquet(contracts, parquet_file_path):
+    """
+    Write contracts to a Parquet file with an explicit schema.
+    :param contracts:
+    :param parquet_file_path: e.g. the parquet_file_path of a profile
+    :return: output.parquet
+    """
+    write_records(contracts, parquet_file_path, columns)
+
+    print('Parquet file has been generated.')
 
 
-def write_xlsx(contracts):
+def write_xlsx(contracts, xlsx_file_path):
     """
     Write contracts to an Excel file.
     :param contracts:
+    :param xlsx_file_path: e.g. the xlsx_file_path of a profile
     :return: output.xlsx
     """
-    wb = Workbook()
-    sheet = wb.active
-
-    # Define the header row
-    header = [field.replace('_', '-') for field in fieldnames]
-    sheet.append(header)
-
-    # Write the contract data
-    for contract in contracts:
-        contract_data = []
-        for field in fieldnames:
-            value = getattr(contract, field)
-            if field == "description":
-                sanitized_value = re.sub(r'[\\/*?:\[\]]', '', str(value))
-                contract_data.append(sanitized_value)
-            else:
-                contract_data.append(value)
-        sheet.append(contract_data)
-
-    # Save the workbook to an XLSX file
-    wb.save(xlsx_file_path)
+    xlsx_columns, converters = output_columns(xlsx_file_path)
+    write_records(contracts, xlsx_file_path, xlsx_columns, converters=converters)
 
     print('XLSX file has been generated.')
 
 
-def test():
+def test(profile):
     """
     Legacy function.
     """
-    search_query = "/ezsearch/search.do?indexName=awardfull&templateName=1.5.3&s=FPDS.GOV&q=sbir+phase+iii"
     # Loop over all search results
-    urls = [BASE_URL + search_query + "&start=" + str(i * 30) for i in range(TOTAL_COUNT // 30 + 1)]
+    urls = [BASE_URL + profile.search_query + "&start=" + str(i * 30) for i in range(TOTAL_COUNT // 30 + 1)]
     count = 0
     for url in urls:
         count += 1
         print(count)
-        get_contract_info_for_30(url)
+        get_contract_info_for_30(url, profile)
 
 
-if __name__ == "__main__":
-    # print(get_target_urls())
-    output = thread_crawl()
+def run_profile(profile, args):
+    """
+    Run the crawl requested on the command line for one profile and write its outputs.
+
+    :param profile: Profile to crawl
+    :param args: parsed command line arguments of main()
+    """
+    if args.summary:
+        write_records(summary_crawl(profile), profile.summary_file_path, columns)
+        return
+    if args.delta:
+        new_contracts, high_water_mark = delta_crawl(profile)
+        write_records(new_contracts, profile.delta_file_path, columns)
+        update_aggregate(read_table(profile.delta_file_path), profile.parquet_file_path, profile.aggregate_file_path)
+        save_high_water_mark(profile, high_water_mark)
+        return
+    # print(get_target_urls(profile)[0])
+    output = enrich_summaries(profile) if args.enrich else thread_crawl(profile, resume=args.resume)
     try:
-        write_xlsx(output)
+        write_parquet(output, profile.parquet_file_path)
     except Exception as e:
-        print(f"Error occurred while writing to XLSX: {e}")
+        print(f"Error occurred while writing to Parquet: {e}")
         print("Attempting to write to CSV instead...")
         try:
-            write_csv(output)
+            write_csv(output, profile.csv_file_path)
         except Exception as e:
             print(f"Error occurred while writing to CSV: {e}")
-            print("Both XLSX and CSV write operations failed.")
-    # write(process_crawl())
-    # test()
+            print("Both Parquet and CSV write operations failed.")
+    if args.xlsx:
+        write_xlsx(output, profile.xlsx_file_path)
+    # write(process_crawl(profile))
+    # test(profile)
+
+
+def main(argv=None):
+    """
+    Command line entry point, also run by sbir_data.py fpds crawl.
+
+    Every requested profile is crawled in a thread of its own. The profiles share the HTTP session, sized to all of
+    their workers, the per-host throttles and the response cache, so a page listed by several programs is served
+    from the cache once either of them has downloaded it.
+
+    :param argv: command line arguments, sys.argv by default
+    """
+    parser = argparse.ArgumentParser(description="Crawl SBIR/STTR phase III contracts from fpds.gov")
+    parser.add_argument('profiles', nargs='*',
+                        help=f"run profiles to crawl ({', '.join(profile_names())}), all by default")
+    parser.add_argument('--resume', action='store_true', help="continue an interrupted crawl from the journal")
+    parser.add_argument('--xlsx', action='store_true', help="also export the contracts to XLSX")
+    parser.add_argument('--delta', action='store_true',
+                        help="only crawl the modifications made since the last run and update the output in place")
+    parser.add_argument('--summary', action='store_true',
+                        help="only crawl the listing pages and write partial contracts to summary_<profile>.parquet")
+    parser.add_argument('--enrich', action='store_true',
+                        help="fetch the detail pages of the contracts in summary_<profile>.parquet and write the output")
+    args = parser.parse_args(argv)
+    try:
+        profiles = load_profiles(args.profiles, frontier_key=detail_key)
+    except ValueError as exception:
+        parser.error(str(exception))
+
+    http.configure(pool_size=sum(profile.max_workers ** 2 for profile in profiles))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(profiles)) as executor:
+        future_profiles = {executor.submit(run_profile, profile, args): profile for profile in profiles}
+        for future in concurrent.futures.as_completed(future_profiles):
+            try:
+                future.result()
+            except Exception as exception:
+                logger.error(f"Profile {future_profiles[future].name} failed: {exception}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+import os
+import sys
+from html.parser import HTMLParser
+from urllib.parse import parse_qs, urlsplit
+
+from contract import Contract
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.parsing import parse_amount, parse_date
+
+# input ids on the detail page and the Contract field each one fills
+INPUT_FIELDS = {
+    'PIID': 'award_id',
+    'idvPIID': 'ref_idv_id',
+    'solicitationID': 'solicitation_id',
+    'modNumber': 'mod_number',
+    'obligatedAmount': 'obligated_amount',
+    'totalObligatedAmount': 'total_obligated_amount',
+    'signedDate': 'signed_date',
+    'contractingOfficeAgencyID': 'contracting_office_id',
+    'contractingOfficeAgencyName': 'contracting_office',
+    'fundingRequestingAgencyID': 'funding_request_id',
+    'fundingRequestingAgencyName': 'funding_request',
+    'vendorName': 'legal_business_name',
+    'vendorDoingAsBusinessName': 'DBAN',
+    'vendorCity': 'city',
+    'vendorState': 'state',
+    'UEINumber': 'unique_entity_id',
+}
+
+# checkbox rows for contracts after 2010, mapped to the Contract field each one fills
+CATEGORY_ROWS = {
+    'busTypestr': 'business_type',
+    'lobtr': 'line_of_business',
+    'relWithFedGovtr': 'relationship_with_government',
+    'otherGovEnttr': 'other_government_entities',
+    'orgFactorstr': 'organization_factors',
+    'eduEnttr': 'educational_entities',
+    'certtr': 'certifications',
+    'sociotr': 'socio_data',
+}
+
+# for contracts before 2010, socio data sits in the third cell of the row following this one
+LEGACY_SOCIO_ROW = 'ccrVersion'
+LEGACY_SOCIO_CELL = 3
+
+AWARD_TYPE_CELL = 'displayAwardType'
+DESCRIPTION_TEXTAREA = 'descriptionOfContractRequirement'
+VENDOR_DETAILS_ROW = 'vendorDetails'
+
+# result box tables of listing pages, one per modification
+RESULT_BOX_CLASSES = {'resultbox1', 'resultbox2'}
+
+# labels shown in a result box and the Contract field each one fills
+LISTING_FIELDS = {
+    'Award ID': 'award_id',
+    'Referenced IDV': 'ref_idv_id',
+    'Mod': 'mod_number',
+    'Modification Number': 'mod_number',
+    'Award Type': 'award_type',
+    'Solicitation ID': 'solicitation_id',
+    'Action Obligation': 'obligated_amount',
+    'Total Obligated Amount': 'total_obligated_amount',
+    'Date Signed': 'signed_date',
+    'Contracting Agency ID': 'contracting_office_id',
+    'Contracting Agency': 'contracting_office',
+    'Funding Agency ID': 'funding_request_id',
+    'Funding Agency': 'funding_request',
+    'Vendor Name': 'legal_business_name',
+    'Legal Business Name': 'legal_business_name',
+    'Vendor City': 'city',
+    'Vendor State': 'state',
+    'Unique Entity ID': 'unique_entity_id',
+}
+
+# query parameters of the View link and the Contract field each one fills when its label is missing
+VIEW_LINK_FIELDS = {
+    'PIID': 'award_id',
+    'idvPIID': 'ref_idv_id',
+    'modNumber': 'mod_number',
+}
+
+
+class DetailPageParser(HTMLParser):
+    """
+    Single-pass parser for FPDS contract detail pages.
+
+    Collects every known input value, checkbox row, award type and description while the page streams through,
+    instead of building a tree and searching it once per field.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.values = {}
+        self.categories = {field: [] for field in CATEGORY_ROWS.values()}
+        self.legacy_socio_data = []
+        self.award_type = ""
+        self.description = ""
+        self.has_socio_data = True
+        self._award_type_seen = False
+
+        # ids of the currently open rows, innermost last
+        self._rows = []
+        self._td_depth = 0
+        # text capture: (target, td depth at which the capture closes, collected pieces)
+        self._capture = None
+        # checkboxes waiting for the text of their next cell: (target list, is_checked, legacy layout)
+        self._pending = []
+        self._description_parts = None
+
+        # legacy socio layout tracking
+        self._after_legacy_row = None
+        self._legacy_row_depth = None
+        self._legacy_td_depth = None
+        self._legacy_cell = 0
+        self._in_legacy_cell = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'input':
+            self._handle_input(attrs)
+        elif tag == 'tr':
+            self._handle_row(attrs)
+        elif tag == 'td':
+            self._handle_cell(attrs.get('id'))
+        elif tag == 'textarea' and attrs.get('id') == DESCRIPTION_TEXTAREA:
+            self._description_parts = []
+
+    def handle_endtag(self, tag):
+        if tag == 'tr':
+            if self._rows:
+                row_id = self._rows.pop()
+                if row_id == LEGACY_SOCIO_ROW:
+                    self._after_legacy_row = len(self._rows)
+                elif self._legacy_row_depth is not None and len(self._rows) == self._legacy_row_depth:
+                    self._legacy_row_depth = None
+                    self._in_legacy_cell = False
+                if self._after_legacy_row is not None and len(self._rows) < self._after_legacy_row:
+                    # the table ended without another row after the sentinel
+                    self._after_legacy_row = None
+        elif tag == 'td':
+            if self._td_depth:
+                self._td_depth -= 1
+            if self._capture and self._td_depth < self._capture[1]:
+                self._finish_capture()
+            if self._in_legacy_cell and self._td_depth < self._legacy_td_depth:
+                self._in_legacy_cell = False
+        elif tag == 'textarea' and self._description_parts is not None:
+            self.description = ''.join(self._description_parts).strip()
+            self._description_parts = None
+
+    def handle_data(self, data):
+        if self._capture:
+            self._capture[2].append(data)
+        if self._description_parts is not None:
+            self._description_parts.append(data)
+
+    def _handle_input(self, attrs):
+        input_id = attrs.get('id')
+        if input_id in INPUT_FIELDS:
+            if 'value' in attrs and INPUT_FIELDS[input_id] not in self.values:
+                self.values[INPUT_FIELDS[input_id]] = attrs['value'] or ""
+            return
+        if attrs.get('type') != 'checkbox':
+            return
+        is_checked = attrs.get('checked') == 'true'
+        if self._in_legacy_cell:
+            self._pending.append((self.legacy_socio_data, is_checked, True))
+        for row_id in reversed(self._rows):
+            if row_id in CATEGORY_ROWS:
+                self._pending.append((self.categories[CATEGORY_ROWS[row_id]], is_checked, False))
+                break
+
+    def _handle_row(self, attrs):
+        row_id = attrs.get('id')
+        if row_id == VENDOR_DETAILS_ROW and 'display:none' in (attrs.get('style') or ""):
+            self.has_socio_data = False
+        if self._after_legacy_row is not None and len(self._rows) == self._after_legacy_row:
+            self._after_legacy_row = None
+            self._legacy_row_depth = len(self._rows)
+            self._legacy_td_depth = self._td_depth + 1
+            self._legacy_cell = 0
+        self._rows.append(row_id)
+
+    def _handle_cell(self, cell_id):
+        self._td_depth += 1
+        if (self._legacy_row_depth is not None and len(self._rows) == self._legacy_row_depth + 1
+                and self._td_depth == self._legacy_td_depth):
+            self._legacy_cell += 1
+            self._in_legacy_cell = self._legacy_cell == LEGACY_SOCIO_CELL
+        if cell_id == AWARD_TYPE_CELL and not self._award_type_seen:
+            self._award_type_seen = True
+            if self._capture is None and not self._pending:
+                self._capture = (AWARD_TYPE_CELL, self._td_depth, [])
+                return
+        if self._capture is None and self._pending:
+            # the text of the next cell names every checkbox seen since the previous one
+            self._capture = (self._pending, self._td_depth, [])
+            self._pending = []
+
+    def _finish_capture(self):
+        target, _, pieces = self._capture
+        self._capture = None
+        if target == AWARD_TYPE_CELL:
+            self.award_type = ''.join(pieces)
+            return
+        for categories, is_checked, strip_pieces in target:
+            if is_checked:
+                if strip_pieces:
+                    categories.append(''.join(piece.strip() for piece in pieces))
+                else:
+                    categories.append(''.join(pieces).strip())
+
+
+def extract_contract(html, contract):
+    """
+    Fill a Contract object from the HTML of a contract detail page in a single streaming pass.
+    Amounts are parsed into integer cents and the signed date into a date.
+
+    :param html: HTML text of the contract detail page
+    :param contract: Contract object to fill
+    :return: the same Contract object
+    """
+    parser = DetailPageParser()
+    parser.feed(html)
+    parser.close()
+
+    for field, value in parser.values.items():
+        setattr(contract, field, value)
+    contract.set_obligated_amount(parse_amount(contract.obligated_amount))
+    contract.set_total_obligated_amount(parse_amount(parser.values.get('total_obligated_amount', '$0.00')))
+    contract.set_signed_date(parse_date(contract.signed_date))
+    contract.set_award_type(parser.award_type)
+
+    if not parser.has_socio_data:
+        contract.toggle_has_socio_data()
+        for field, categories in parser.categories.items():
+            setattr(contract, field, ",".join(categories))
+    else:
+        contract.set_socio_data(",".join(parser.legacy_socio_data))
+
+    contract.set_description(parser.description)
+    return contract
+
+
+class ListingPageParser(HTMLParser):
+    """
+    Single-pass parser for the result boxes of FPDS listing pages.
+
+    Every result box holds the summary of one modification: labelled values followed by a View link to its detail
+    page. The text of a box is collected in order, and a label is paired with the text that follows it.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        # (detail link, list of texts) of every result box
+        self.boxes = []
+        self._box_depth = 0
+        self._in_view_link = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'table':
+            if self._box_depth:
+                self._box_depth += 1
+            elif RESULT_BOX_CLASSES & set((attrs.get('class') or '').split()):
+                self._box_depth = 1
+                self.boxes.append([None, []])
+        elif tag == 'a' and self._box_depth and attrs.get('title') == 'View':
+            href = attrs.get('href') or ''
+            if "('/" in href and "')" in href:
+                self.boxes[-1][0] = href[href.index("('/") + 2:href.index("')")]
+            self._in_view_link = True
+
+    def handle_endtag(self, tag):
+        if tag == 'table' and self._box_depth:
+            self._box_depth -= 1
+        elif tag == 'a':
+            self._in_view_link = False
+
+    def handle_data(self, data):
+        data = data.strip()
+        if self._box_depth and data and not self._in_view_link:
+            self.boxes[-1][1].append(data)
+
+
+def parse_labelled_values(texts):
+    """
+    Pair the labels of a result box with their values, a label directly followed by another one has no value.
+
+    :param texts: texts of a result box, in document order
+    :return: dict of Contract field to text value
+    """
+    values = {}
+    field = None
+    for text in texts:
+        label = text[:-1].strip() if text.endswith(':') else None
+        if label in LISTING_FIELDS:
+            field = LISTING_FIELDS[label]
+            values.setdefault(field, "")
+        elif field is not None:
+            if not values[field]:
+                values[field] = text
+            field = None
+    return values
+
+
+def extract_summaries(html, base_url):
+    """
+    Build partial contracts from the result boxes of a listing page, without fetching any detail page.
+
+    Only the fields shown in the listing are filled; socio data, business categories, certifications and the
+    description stay empty until the detail page is fetched.
+
+    :param html: HTML text of a listing page
+    :param base_url: URL the relative View links are resolved against
+    :return: List of contracts, one per result box with a View link
+    """
+    parser = ListingPageParser()
+    parser.feed(html)
+    parser.close()
+
+    contracts = []
+    for link, texts in parser.boxes:
+        if link is None:
+            continue
+        values = parse_labelled_values(texts)
+        params = parse_qs(urlsplit(link).query, keep_blank_values=True)
+        for param, field in VIEW_LINK_FIELDS.items():
+            if not values.get(field) and params.get(param):
+                values[field] = params[param][0]
+
+        contract = Contract()
+        contract.set_url(base_url + link)
+        for field, value in values.items():
+            setattr(contract, field, value)
+        contract.set_obligated_amount(parse_amount(contract.obligated_amount))
+        contract.set_total_obligated_amount(parse_amount(contract.total_obligated_amount))
+        contract.set_signed_date(parse_date(contract.signed_date))
+        contracts.append(contract)
+    return contracts
@@ -0,0 +1,219 @@
+import logging
+import queue
+import sys
+import threading
+
+from tqdm import tqdm
+
+from crawler import (AWARD_QUERY, cache, detail_key, load_profiles, get_award_queries, get_listing_links,
+                     get_page_url, get_page_urls, parse_award_ids, parse_result_total, parse_view_links,
+                     partition_search, process_contract)
+from common.frontier import Frontier
+from common.sinks import open_sink
+from schema import output_columns
+
+logger = logging.getLogger(__name__)
+
+# worker threads per stage
+WORKERS = {
+    'search': 8,
+    'query': 16,
+    'listing': 16,
+    'detail': 64,
+}
+
+# queue size between stages, producers block when the next stage falls behind
+QUEUE_SIZE = 1000
+
+# end of stream marker
+DONE = object()
+
+
+class Stage:
+    """
+    A pool of worker threads reading items from an inbox and putting results into the next stage's inbox.
+
+    :param name: stage name used in logs
+    :param func: function mapping one item to an iterable of output items
+    :param workers: number of worker threads
+    :param outbox: inbox of the next stage, or None for the last stage
+    :param on_finish: optional function returning extra items to emit once every input item is processed
+    """
+
+    def __init__(self, name, func, workers, outbox=None, on_finish=None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.inbox = queue.Queue(maxsize=QUEUE_SIZE)
+        self.outbox = outbox
+        self.on_finish = on_finish
+        self.downstream_workers = 1
+        self._running = workers
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._work, name=f'{name}-{i}', daemon=True)
+                         for i in range(workers)]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _emit(self, items):
+        if self.outbox is None:
+            return
+        for item in items or ():
+            self.outbox.put(item)
+
+    def _work(self):
+        while True:
+            item = self.inbox.get()
+            if item is DONE:
+                break
+            try:
+                self._emit(self.func(item))
+            except Exception as exception:
+                logger.error(f"An unexpected error occurred in stage {self.name} for {item}: {exception}")
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+        if last:
+            # the last worker out closes the stream for the next stage
+            if self.on_finish:
+                self._emit(self.on_finish())
+            if self.outbox is not None:
+                for _ in range(self.downstream_workers):
+                    self.outbox.put(DONE)
+
+
+class Pipeline:
+    """
+    Streaming FPDS crawl: search pages -> award queries -> listing pages -> detail pages -> sink.
+
+    Every stage starts as soon as the previous one produces its first item, so detail pages are fetched while
+    award IDs are still being discovered, and finished contracts go straight to the sink instead of a list.
+
+    Search and listing pages travel between stages as (URL, parsed page) pairs. The first page of a search shard or
+    award query is its count probe: it is parsed once and handed on, the other pages are fetched by their stage.
+    """
+
+    def __init__(self, sink, search_query, workers=None):
+        workers = {**WORKERS, **(workers or {})}
+        self.workers = workers
+        self.sink = sink
+        self.search_query = search_query
+        self.pbar = tqdm(ncols=120, unit=' contracts')
+        self._lock = threading.Lock()
+        self._seen_queries = set()
+        self._award_ids = set()
+        self._awards_with_idv = set()
+        # detail links listed by several award queries are fetched once
+        self.frontier = Frontier(detail_key)
+
+        self.detail = Stage('detail', self.process_detail, workers['detail'])
+        self.listing = Stage('listing', self.process_listing, workers['listing'], self.detail.inbox)
+        self.query = Stage('query', self.process_query, workers['query'], self.listing.inbox)
+        self.search = Stage('search', self.process_search_page, workers['search'], self.query.inbox,
+                            on_finish=self.remaining_queries)
+        self.stages = [self.search, self.query, self.listing, self.detail]
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.downstream_workers = next_stage.workers
+
+    def run(self):
+        """
+        Run every stage until the last contract is written.
+
+        :return: number of contracts written to the sink
+        """
+        # large searches are split into signed date shards, like the award ID discovery of crawler.py
+        shards = partition_search(self.search_query, self.workers['search'])
+        for stage in self.stages:
+            stage.start()
+        for query, total, html in shards:
+            self.search.inbox.put((get_page_url(query, 0), html))
+            for url in get_page_urls(query, total)[1:]:
+                self.search.inbox.put((url, None))
+        for _ in range(self.search.workers):
+            self.search.inbox.put(DONE)
+        for stage in self.stages:
+            stage.join()
+        self.pbar.close()
+        return self.sink.count
+
+    def new_queries(self, queries):
+        with self._lock:
+            queries = [query for query in queries if query not in self._seen_queries]
+            self._seen_queries.update(queries)
+        return queries
+
+    def process_search_page(self, item):
+        url, html = item
+        award_ids, idv_ids = parse_award_ids(html or cache.fetch(url, timeout=60))
+        with self._lock:
+            self._award_ids.update(award_ids)
+            self._awards_with_idv.update(idv_ids)
+        queries = []
+        for award_id, idvs in idv_ids.items():
+            queries += get_award_queries(award_id, idvs)
+        return self.new_queries(queries)
+
+    def remaining_queries(self):
+        # an award is only queried without IDV once discovery shows it has no referenced IDV at all
+        return self.new_queries([AWARD_QUERY.format(award_id)
+                                 for award_id in self._award_ids - self._awards_with_idv])
+
+    def process_query(self, query):
+        first_url = get_page_url(query, 0)
+        html = cache.fetch(first_url, timeout=60)
+        total = parse_result_total(html)
+        try:
+            links = parse_view_links(html)
+        except Exception as exception:
+            # the listing stage fetches the page again
+            logger.warning(f"Could not parse the first listing page {first_url}: {exception}")
+            links = None
+        return [(first_url, links)] + [(url, None) for url in get_page_urls(query, total)[1:]]
+
+    def process_listing(self, item):
+        url, links = item
+        links = get_listing_links(url, links)
+        if not links:
+            logger.error(f"Could not retrieve listing page: {url}")
+        return self.frontier.filter(links)
+
+    def process_detail(self, link):
+        contract = process_contract(link)
+        if contract is not None and not contract.award_id:
+            logger.info(f"Empty value. Retrying for: {link}")
+            contract = process_contract(link)
+        if contract is None or not contract.award_id:
+            logger.error(f"Could not retrieve contract: {link}")
+            return
+        with self._lock:
+            self.sink.write(contract)
+            self.pbar.update(1)
+
+
+def pipeline_crawl(profile, output_path=None, workers=None):
+    """
+    Crawl every contract of a profile and stream the records to an output file as they are produced.
+
+    :param profile: Profile whose search is crawled
+    :param output_path: path of a .parquet, .csv, .jsonl or .xlsx file, the output of the profile by default
+    :param workers: optional mapping of stage name to worker count
+    :return: number of contracts written
+    """
+    output_path = output_path or profile.parquet_file_path
+    # CSV and XLSX outputs are formatted like the exports of crawler.py
+    sink_columns, converters = output_columns(output_path)
+    with open_sink(output_path, sink_columns, converters=converters) as sink:
+        count = Pipeline(sink, profile.search_query, workers).run()
+    print('total contracts: ' + str(count))
+    return count
+
+
+if __name__ == "__main__":
+    for profile in load_profiles(sys.argv[1:], frontier_key=detail_key):
+        pipeline_crawl(profile)
@@ -0,0 +1,98 @@
+import os
+import sys
+from functools import cached_property
+from urllib.parse import quote_plus
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.config import MAX_WORKERS, load_config, get_section
+from common.frontier import Frontier, canonicalize_url
+from common.journal import Journal
+
+# ezsearch query of a profile, filled with its search terms
+SEARCH_QUERY = "/ezsearch/search.do?indexName=awardfull&templateName=1.5.3&s=FPDS.GOV&q={}"
+
+# built-in profiles, overridden by the [profile] and [profile <name>] sections of settings.ini
+PROGRAMS = {
+    'sbir': 'sbir phase iii',
+    'sttr': 'sttr phase iii',
+}
+
+
+class Profile:
+    """
+    Run profile of one program: the search it crawls, the files it writes and how many threads it uses.
+
+    Every file defaults to a name of its own, e.g. output_sttr.parquet and journal_sttr.sqlite, so several profiles
+    can run in one process. The journal and the frontier of detail links are only created once a crawl uses them.
+
+    :param name: profile name, e.g. sttr
+    :param settings: dict of option name to raw string value, see settings.ini
+    :param frontier_key: function mapping a URL to its deduplication key in the frontier
+    """
+
+    def __init__(self, name, settings, frontier_key=canonicalize_url):
+        self.name = name
+        self.query = settings['query']
+        self.search_query = SEARCH_QUERY.format(quote_plus(self.query))
+        self.parquet_file_path = settings.get('output') or f'output_{name}.parquet'
+        base_path = os.path.splitext(self.parquet_file_path)[0]
+        self.csv_file_path = base_path + '.csv'
+        self.xlsx_file_path = base_path + '.xlsx'
+        self.aggregate_file_path = settings.get('aggregate') or f'aggregate_{name}.parquet'
+        # summary crawls keep the listing fields only, until the detail pages are fetched by an enrichment pass
+        self.summary_file_path = settings.get('summary') or f'summary_{name}.parquet'
+        # delta crawls write new modifications here before they are merged into the output and its aggregate
+        self.delta_file_path = settings.get('delta') or f'delta_{name}.parquet'
+        self.journal_path = settings.get('journal') or f'journal_{name}.sqlite'
+        self.max_workers = int(settings.get('max_workers') or MAX_WORKERS)
+        self.frontier_key = frontier_key
+
+    def __repr__(self):
+        return f'Profile({self.name!r}, query={self.query!r})'
+
+    @cached_property
+    def journal(self):
+        """
+        Work journal of the profile, so an interrupted crawl can be resumed with --resume.
+        """
+        return Journal(self.journal_path)
+
+    @cached_property
+    def frontier(self):
+        """
+        Detail links seen in the current run of the profile, overlapping award queries list the same modifications.
+        """
+        return Frontier(self.frontier_key)
+
+
+def profile_names(config=None):
+    """
+    Names of the built-in and configured profiles, in order.
+    """
+    config = config or load_config()
+    names = list(PROGRAMS)
+    for section in config.sections():
+        kind, _, name = section.partition(' ')
+        if kind == 'profile' and name and name not in names:
+            names.append(name)
+    return names
+
+
+def load_profiles(names=None, config=None, frontier_key=canonicalize_url):
+    """
+    Load run profiles from settings.ini, each section merged over the [profile] defaults and the built-in query.
+
+    :param names: profile names, every profile by default
+    :param config: optional configparser.ConfigParser, defaults to load_config()
+    :param frontier_key: deduplication key of the frontier of every profile
+    :return: List of Profile objects
+    """
+    config = config or load_config()
+    profiles = []
+    for name in dict.fromkeys(names or profile_names(config)):
+        settings = get_section(config, f'profile {name}', 'profile')
+        settings.setdefault('query', PROGRAMS.get(name))
+        if not settings['query']:
+            raise ValueError(f"Unknown profile {name}, add a [profile {name}] section with a query to settings.ini")
+        profiles.append(Profile(name, settings, frontier_key))
+    return profiles
@@ -0,0 +1,81 @@
+import os
+import re
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.parsing import format_amount, format_date
+
+# required fields
+fieldnames = ['url', 'solicitation_id', 'mod_number', 'award_id', 'ref_idv_id', 'award_type', 'obligated_amount',
+              'total_obligated_amount', 'signed_date', 'contracting_office_id', 'contracting_office',
+              'funding_request_id', 'funding_request', 'legal_business_name', 'DBAN', 'city', 'state',
+              'unique_entity_id', 'has_socio_data', 'business_type', 'socio_data', 'line_of_business',
+              'relationship_with_government', 'other_government_entities', 'organization_factors',
+              'educational_entities', 'certifications', 'description']
+
+# Parquet type of every field: amounts in cents, low-cardinality text dictionary-encoded
+field_types = {
+    'url': 'string',
+    'solicitation_id': 'string',
+    'mod_number': 'string',
+    'award_id': 'string',
+    'ref_idv_id': 'string',
+    'award_type': 'category',
+    'obligated_amount': 'int64',
+    'total_obligated_amount': 'int64',
+    'signed_date': 'date',
+    'contracting_office_id': 'category',
+    'contracting_office': 'category',
+    'funding_request_id': 'category',
+    'funding_request': 'category',
+    'legal_business_name': 'string',
+    'DBAN': 'string',
+    'city': 'string',
+    'state': 'category',
+    'unique_entity_id': 'string',
+    'has_socio_data': 'bool',
+    'business_type': 'category',
+    'socio_data': 'category',
+    'line_of_business': 'category',
+    'relationship_with_government': 'category',
+    'other_government_entities': 'category',
+    'organization_factors': 'category',
+    'educational_entities': 'category',
+    'certifications': 'category',
+    'description': 'string',
+}
+
+# output columns: header name, Contract attribute and Parquet type, headers match the XLSX export
+columns = [(field.replace('_', '-'), field, field_types[field]) for field in fieldnames]
+
+# typed fields are written to XLSX and CSV exports the way fpds.gov shows them
+formatters = {
+    'obligated_amount': format_amount,
+    'total_obligated_amount': format_amount,
+    'signed_date': format_date,
+}
+
+
+def sanitize_description(value):
+    """
+    Strip the characters Excel rejects from a description.
+    """
+    return re.sub(r'[\\/*?:\[\]]', '', str(value))
+
+
+def output_columns(path):
+    """
+    Columns and converters of an output file, by its extension.
+
+    Parquet keeps the typed values, CSV and XLSX exports show them the way fpds.gov does. CSV headers are the
+    Contract attributes, and XLSX descriptions are stripped of the characters Excel rejects.
+
+    :param path: path of a .parquet, .csv, .jsonl or .xlsx file
+    :return: (columns, converters) tuple, converters is None for typed outputs
+    """
+    ext = os.path.splitext(path)[1]
+    if ext == '.csv':
+        return [(field, field, type_name) for _, field, type_name in columns], formatters
+    if ext == '.xlsx':
+        return columns, {**formatters, 'description': sanitize_description}
+    return columns, None
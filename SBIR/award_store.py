@@ -0,0 +1,136 @@
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+logger = logging.getLogger(__name__)
+
+# Award data downloaded from sbir.gov, and the store it is imported into
+AWARD_DATA_PATH = 'award_data.csv'
+STORE_PATH = 'award_data.arrow'
+# Company index of the store
+COMPANY_INDEX_PATH = 'award_data_companies.npz'
+# Repeated text columns, stored dictionary-encoded
+DICTIONARY_COLUMNS = ['Company', 'Agency', 'Branch', 'Phase', 'Program', 'City', 'State']
+# Identifiers kept as text instead of being inferred as numbers, e.g. DUNS numbers with leading zeros
+TEXT_COLUMNS = ['Contract', 'Duns', 'UEI', 'Zip', 'Agency Tracking Number', 'Solicitation Number', 'Topic Code']
+# Schema metadata key of the signature of the imported file
+SOURCE_KEY = b'source'
+
+
+# Helper function to identify a version of the award data file
+def signature(path):
+    stat = os.stat(path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+
+class AwardStore:
+    """
+    Memory-mapped Arrow copy of the sbir.gov award data, with a company index.
+
+    The store is an uncompressed Arrow IPC file, so opening it maps the file instead of parsing a CSV, and a column
+    is only read from disk when it is converted. Repeated text such as company, agency and program names is
+    dictionary-encoded and converts to categorical columns. Rows keep the order of the CSV.
+
+    The company index is stored in CSR form: the rows of companies[i] are rows[indptr[i]:indptr[i + 1]], in
+    ascending order, and companies are sorted so a name is found by binary search.
+
+    :param table: pyarrow.Table backed by the memory map
+    :param companies: distinct company names, sorted
+    :param indptr: offsets of the rows of every company
+    :param rows: row ids of all companies
+    """
+
+    def __init__(self, table, companies, indptr, rows):
+        self.table = table
+        self.companies = companies
+        self.indptr = indptr
+        self.rows = rows
+        self.source = (table.schema.metadata or {}).get(SOURCE_KEY, b'').decode()
+
+    def __len__(self):
+        return self.table.num_rows
+
+    @classmethod
+    def build(cls, csv_path=AWARD_DATA_PATH, path=STORE_PATH, index_path=COMPANY_INDEX_PATH):
+        """
+        Import the award data CSV into the store and its company index.
+        """
+        table = pa_csv.read_csv(csv_path, parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+                                convert_options=pa_csv.ConvertOptions(
+                                    column_types={name: pa.string() for name in TEXT_COLUMNS},
+                                    strings_can_be_null=True))
+        # one chunk per column, so every dictionary covers the whole column
+        table = table.combine_chunks()
+        for name in DICTIONARY_COLUMNS:
+            if name in table.column_names:
+                table = table.set_column(table.column_names.index(name), name,
+                                         table.column(name).dictionary_encode())
+        table = table.replace_schema_metadata({SOURCE_KEY: signature(csv_path)})
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+        codes, companies = pd.factorize(table.column('Company').to_pandas().astype(object), sort=True)
+        named = codes >= 0
+        rows = np.flatnonzero(named)[np.argsort(codes[named], kind='stable')]
+        indptr = np.zeros(len(companies) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes[named], minlength=len(companies)), out=indptr[1:])
+        np.savez(index_path, companies=np.array(companies, dtype=str), indptr=indptr, rows=rows)
+        return cls.load(path, index_path)
+
+    @classmethod
+    def load(cls, path=STORE_PATH, index_path=COMPANY_INDEX_PATH):
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        with np.load(index_path) as f:
+            return cls(table, f['companies'], f['indptr'], f['rows'])
+
+    @classmethod
+    def load_or_import(cls, csv_path=AWARD_DATA_PATH, path=STORE_PATH, index_path=COMPANY_INDEX_PATH):
+        """
+        Open the store, importing the award data first when there is no store yet or the CSV changed since.
+        """
+        if os.path.exists(path) and os.path.exists(index_path):
+            store = cls.load(path, index_path)
+            if not os.path.exists(csv_path) or store.source == signature(csv_path):
+                return store
+            logger.info(f"{csv_path} changed since {path} was imported, importing it again")
+        return cls.build(csv_path, path, index_path)
+
+    def frame(self, columns=None):
+        """
+        Convert columns of the store to a DataFrame, only the requested columns are read.
+
+        :param columns: column names, every column by default
+        :return: pandas.DataFrame, dictionary-encoded columns as categoricals
+        """
+        table = self.table if columns is None else self.table.select(columns)
+        return table.to_pandas()
+
+    def company_rows(self, company):
+        """
+        Row ids of the awards of a company, in file order, empty if the company has no award.
+        """
+        i = np.searchsorted(self.companies, company)
+        if i == len(self.companies) or self.companies[i] != company:
+            return self.rows[:0]
+        return self.rows[self.indptr[i]:self.indptr[i + 1]]
+
+
+# Function to import the award data from the command line, also run by sbir_data.py sbir store
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import the sbir.gov award data into a memory-mapped store")
+    parser.add_argument('csv_path', nargs='?', default=AWARD_DATA_PATH, help="award data downloaded from sbir.gov")
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    store = AwardStore.build(args.csv_path)
+    print(f'{len(store)} awards of {len(store.companies)} companies imported into {STORE_PATH} '
+          f'in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
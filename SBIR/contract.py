@@ -1,10 +1,15 @@
 class Contract:
+    # fixed set of fields without a per-instance __dict__
+    __slots__ = ('legal_business_name', 'company', 'award_year', 'agency', 'amount', 'phase', 'program', 'url',
+                 'contract_id', 'DUNS')
+
     def __init__(self):
         self.legal_business_name = ""
         self.company = ""
-        self.award_year = ""
+        # award year as an int, amount in integer cents
+        self.award_year = None
         self.agency = ""
-        self.amount = ""
+        self.amount = None
         self.phase = ""
         self.program = ""
         self.url = ""
@@ -12,7 +17,17 @@ class Contract:
         self.DUNS = ""
 
     def __str__(self):
-        return f"ContractInfo: {vars(self)}"
+        return f"ContractInfo: {self.to_dict()}"
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        contract = cls()
+        for field, value in data.items():
+            setattr(contract, field, value)
+        return contract
 
     def set_business(self, business):
         self.legal_business_name = business
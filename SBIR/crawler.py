@@ -1,23 +1,56 @@
-import csv
+import argparse
 import logging
 import os
 import random
+import sys
 import time
-from fuzzywuzzy import process, fuzz
 
-import requests
 from bs4 import BeautifulSoup
-import pandas as pd
 
-from concurrent.futures import ThreadPoolExecutor, as_completed, ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from openpyxl.workbook import Workbook
 from tqdm import tqdm
 from contract import Contract
+from fuzz_match import read_companies
+from join import join_awards, process_specials
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import http
+from common.cache import load_cache
+from common.config import MAX_WORKERS
+from common.frontier import Frontier
+from common.journal import Journal, DONE, FAILED
+from common.parsing import format_amount, parse_amount, parse_int
+from common.sinks import write_records
 
 # Define constants
 BASE_URL = "https://www.sbir.gov"
 TIME_OUT = 60
+# Awards per page of the sbir.gov search results
+SEARCH_PAGE_SIZE = 10
+# Output columns: header name, Contract attribute and Parquet type, headers match the XLSX export
+# Amounts are in integer cents, low-cardinality text is dictionary-encoded
+COLUMNS = [
+    ('FPDS_legal business name', 'legal_business_name', 'string'),
+    ('SBIR_company', 'company', 'string'),
+    ('year', 'award_year', 'int64'),
+    ('agency', 'agency', 'category'),
+    ('amount', 'amount', 'int64'),
+    ('program', 'program', 'category'),
+    ('phase', 'phase', 'category'),
+    ('url', 'url', 'string'),
+    ('contract ID', 'contract_id', 'string'),
+    ('DUNS', 'DUNS', 'string'),
+]
+# Amounts are written to XLSX and CSV exports the way sbir.gov shows them
+FORMATTERS = {'amount': format_amount}
+
+# Response cache, so re-runs only download search listings and new award pages, set in the [cache] section
+cache = load_cache()
+
+# Work journal, so an interrupted crawl can be resumed with --resume
+JOURNAL_PATH = "journal.sqlite"
+journal = Journal(JOURNAL_PATH)
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -27,123 +60,167 @@ logging.basicConfig(level=logging.INFO,
 
 # Function to scrape contract information from a given URL
 def scrape_contract_info(url, firm, company):
-    retry_count = 0
-    max_retries = 3
-    while retry_count < max_retries:
-        try:
-            logger.info(f"Processing url for {company}: {url}")
-            contract = Contract()
-            contract_resp = requests.get(BASE_URL + url, timeout=TIME_OUT)
-            contract_soup = BeautifulSoup(contract_resp.text, 'html.parser')
-            award_info = contract_soup.find('div', class_='award-info-wrapper')
-            agency_label = award_info.find('span', class_='open-label', string='Agency:')
-            year_label = award_info.find('span', class_='open-label', string='Award Year:')
-            amount_label = award_info.find('span', class_='open-label', string='Amount:')
-            phase_label = award_info.find('span', class_='open-label', string='Phase:')
-            program_label = award_info.find('span', class_='open-label', string='Program:')
-            contract_id_label = award_info.find('span', class_='open-label', string='Contract:')
-            DUNS_label = award_info.find('span', class_='open-label', string='DUNS:')
-            if agency_label and agency_label.find_next_sibling('span', class_='open-description'):
-                agency = agency_label.find_next_sibling('span', class_='open-description').text
-            else:
-                agency = ""
-            if year_label and year_label.find_next_sibling('span', class_='open-description'):
-                award_year = year_label.find_next_sibling('span', class_='open-description').text
-            else:
-                award_year = ""
-            if amount_label and amount_label.find_next_sibling('span', class_='open-description'):
-                amount = amount_label.find_next_sibling('span', class_='open-description').text
-            else:
-                amount = ""
-            if phase_label and phase_label.find_next_sibling('span', class_='open-description'):
-                phase = phase_label.find_next_sibling('span', class_='open-description').text
-            else:
-                phase = ""
-            if program_label and program_label.find_next_sibling('span', class_='open-description'):
-                program = program_label.find_next_sibling('span', class_='open-description').text
-            else:
-                program = ""
-            if contract_id_label and contract_id_label.find_next_sibling('span', class_='open-description'):
-                contract_id = contract_id_label.find_next_sibling('span', class_='open-description').text
-            else:
-                contract_id = ""
-            if DUNS_label and DUNS_label.find_next_sibling('span', class_='open-description'):
-                duns = DUNS_label.find_next_sibling('span', class_='open-description').text
-            else:
-                duns = ""
-            contract.set_url(BASE_URL + url)
-            contract.set_business(firm)
-            contract.set_company(company)
-            contract.set_agency(agency)
-            contract.set_award_year(award_year)
-            contract.set_amount(amount)
-            contract.set_phase(phase)
-            contract.set_program(program)
-            contract.set_conract_id(contract_id)
-            contract.set_DUNS(duns)
-            return contract
-        except Exception as e:
-            logger.error(f"An error occurred while scraping contract info for {firm} - URL: {url}: {e}")
-            retry_count += 1
-            if retry_count <= max_retries:
-                logger.info(f"Retrying... Retry count: {retry_count}")
-            else:
-                logger.error(f"Max retry count reached. Skipping contract - URL: {url}")
-                return None
-
-
-# Function to scrape contracts for a given firm
+    try:
+        logger.info(f"Processing url for {company}: {url}")
+        contract = Contract()
+        contract_soup = BeautifulSoup(cache.fetch(BASE_URL + url, timeout=TIME_OUT), 'html.parser')
+        award_info = contract_soup.find('div', class_='award-info-wrapper')
+        agency_label = award_info.find('span', class_='open-label', string='Agency:')
+        year_label = award_info.find('span', class_='open-label', string='Award Year:')
+        amount_label = award_info.find('span', class_='open-label', string='Amount:')
+        phase_label = award_info.find('span', class_='open-label', string='Phase:')
+        program_label = award_info.find('span', class_='open-label', string='Program:')
+        contract_id_label = award_info.find('span', class_='open-label', string='Contract:')
+        DUNS_label = award_info.find('span', class_='open-label', string='DUNS:')
+        if agency_label and agency_label.find_next_sibling('span', class_='open-description'):
+            agency = agency_label.find_next_sibling('span', class_='open-description').text
+        else:
+            agency = ""
+        if year_label and year_label.find_next_sibling('span', class_='open-description'):
+            award_year = year_label.find_next_sibling('span', class_='open-description').text
+        else:
+            award_year = ""
+        if amount_label and amount_label.find_next_sibling('span', class_='open-description'):
+            amount = amount_label.find_next_sibling('span', class_='open-description').text
+        else:
+            amount = ""
+        if phase_label and phase_label.find_next_sibling('span', class_='open-description'):
+            phase = phase_label.find_next_sibling('span', class_='open-description').text
+        else:
+            phase = ""
+        if program_label and program_label.find_next_sibling('span', class_='open-description'):
+            program = program_label.find_next_sibling('span', class_='open-description').text
+        else:
+            program = ""
+        if contract_id_label and contract_id_label.find_next_sibling('span', class_='open-description'):
+            contract_id = contract_id_label.find_next_sibling('span', class_='open-description').text
+        else:
+            contract_id = ""
+        if DUNS_label and DUNS_label.find_next_sibling('span', class_='open-description'):
+            duns = DUNS_label.find_next_sibling('span', class_='open-description').text
+        else:
+            duns = ""
+        contract.set_url(BASE_URL + url)
+        contract.set_business(firm)
+        contract.set_company(company)
+        contract.set_agency(agency)
+        contract.set_award_year(parse_int(award_year))
+        contract.set_amount(parse_amount(amount))
+        contract.set_phase(phase)
+        contract.set_program(program)
+        contract.set_conract_id(contract_id)
+        contract.set_DUNS(duns)
+        return contract
+    except Exception as e:
+        # transient network errors were already retried with backoff by the shared session
+        logger.error(f"An error occurred while scraping contract info for {firm} - URL: {url}: {e}")
+        cache.invalidate(BASE_URL + url)
+        logger.error(f"Skipping contract - URL: {url}")
+        return None
+
+
+# Function to list the award links of a search result page, keeping only the awards of the company itself
+def parse_award_links(search_soup, company):
+    links = []
+    for result in search_soup.find_all('li', class_='search-result'):
+        sub_title = result.find('div', class_='search-result-sub-title')
+        if sub_title and sub_title.find('span') and sub_title.find('span').text[5:] == company:
+            links.append(result.find('a')['href'])
+    return links
+
+
+# Function to fetch one page of the search results of a company, built from the base query
+# Pages past the first always hold results, so a page without any is an error page: like a page that fails, it is
+# dropped from the cache and None is returned
+def scrape_search_page(search_query, page, company):
+    search_url = BASE_URL + search_query + "&page={}".format(page)
+    try:
+        search_soup = BeautifulSoup(cache.fetch(search_url, timeout=TIME_OUT), 'html.parser')
+        if not search_soup.find('li', class_='search-result'):
+            raise ValueError("no search results on the page")
+        return parse_award_links(search_soup, company)
+    except Exception as e:
+        logger.error(f"An error occurred while scraping search page for {company} - URL: {search_url}: {e}")
+        cache.invalidate(search_url)
+        return None
+
+
+# Function to scrape contracts for a given firm, returning them with the number of search and award pages that failed
+# Result pages are fetched concurrently, and the award pages of each one are submitted to the same pool as soon
+# as it arrives
 def scrape_contracts(firm, name_dict):
     if name_dict[firm] == "":
         contract = Contract()
         contract.set_business(firm)
-        return [contract]
+        return [contract], 0
     company = name_dict[firm]
     search_query = "/sbirsearch/award/all/?firm={}".format(company.replace("&", "%20%26%20")) \
         # + "&f%5B0%5D=im_field_phase%3A105788&f%5B1%5D=im_field_program%3A105791"
-    session = requests.Session()
-    search_resp = session.get(BASE_URL + search_query, timeout=TIME_OUT)
-    search_soup = BeautifulSoup(search_resp.text, 'html.parser')
+    search_soup = BeautifulSoup(cache.fetch(BASE_URL + search_query, timeout=TIME_OUT), 'html.parser')
     # logger.info(f"Search firm {firm}")
     counter_element = search_soup.find(class_='search-result-counter')
     if not counter_element:
         contract = Contract()
         contract.set_business(firm)
         contract.set_company(company)
-        return [contract]
+        return [contract], 0
     total_results = int(counter_element.text.strip().split(' ')[-1])
-    search_results = search_soup.find_all('li', class_='search-result')
-    urls = [result.find('a')['href'] for result in search_results
-            if result.find('div', class_='search-result-sub-title').find('span').text[5:] == company]
-
-    for i in range(1, -(-total_results // 10)):
-        search_query += "&page={}".format(i)
-        search_resp = session.get(BASE_URL + search_query, timeout=TIME_OUT)
-        search_soup = BeautifulSoup(search_resp.text, 'html.parser')
-        search_results = search_soup.find_all('li', class_='search-result')
-        urls += [result.find('a')['href'] for result in search_results
-                 if result.find('div', class_='search-result-sub-title').find('span').text[5:] == company]
 
     contracts = []
-    with ThreadPoolExecutor() as executor:
-        futures = [executor.submit(scrape_contract_info, url, firm, company) for url in urls]
+    failed = 0
+    # an award listed on two pages, when results shift while paging, is scraped once
+    award_urls = Frontier()
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [executor.submit(scrape_contract_info, url, firm, company)
+                   for url in award_urls.filter(parse_award_links(search_soup, company))]
+        page_futures = [executor.submit(scrape_search_page, search_query, page, company)
+                        for page in range(1, -(-total_results // SEARCH_PAGE_SIZE))]
+        for page_future in as_completed(page_futures):
+            links = page_future.result()
+            if links is None:
+                failed += 1
+                continue
+            futures += [executor.submit(scrape_contract_info, url, firm, company) for url in award_urls.filter(links)]
         # for future in tqdm(as_completed(futures), total=len(futures), desc='Scraping contracts for {}'.format(firm)):
         for future in as_completed(futures):
             contract = future.result()
             if contract is not None:
                 contracts.append(contract)
+            else:
+                failed += 1
             # time.sleep(random.uniform(1, 3))
 
     # time.sleep(random.uniform(1, 3))
 
+    return contracts, failed
+
+
+# Function to scrape contracts for a firm and record them in the journal
+# A firm with search or award pages that could not be scraped is marked failed, so --resume crawls it again
+def scrape_and_record(firm, name_dict):
+    contracts, failed = scrape_contracts(firm, name_dict)
+    if failed:
+        logger.error(f"{failed} search or award pages of {firm} could not be scraped, marking the firm as failed")
+        journal.mark('firm', firm, FAILED)
+    else:
+        journal.mark('firm', firm, DONE, [contract.to_dict() for contract in contracts])
     return contracts
 
 
 # Function to crawl and scrape contracts for multiple firms
-def crawl(firms, name_dict):
-    all_contracts = []
-    with ThreadPoolExecutor() as executor:
-        futures = [executor.submit(scrape_contracts, firm, name_dict) for firm in firms]
+# With resume, firms already done in the journal are reloaded instead of crawled again
+def crawl(firms, name_dict, resume=False):
+    if not resume:
+        journal.clear()
+    journal.add('firm', firms)
+    done = {firm: records for firm, records in journal.records('firm')}
+    all_contracts = [Contract.from_dict(record) for firm in firms if firm in done for record in done[firm]]
+    firms = [firm for firm in firms if firm not in done]
+    if done:
+        logger.info(f"Resuming with {len(all_contracts)} contracts from the journal, {len(firms)} firms left")
+    http.configure(pool_size=MAX_WORKERS ** 2)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [executor.submit(scrape_and_record, firm, name_dict) for firm in firms]
         for future in tqdm(as_completed(futures), total=len(futures), ncols=120):
             contracts = future.result()
             all_contracts.extend(contracts)
@@ -152,88 +229,6 @@ def crawl(firms, name_dict):
     return all_contracts
 
 
-# Function to read business name data from FPDS system
-def read_businesses(file_paths=None):
-    if file_paths is None:
-        file_paths = ['aggregate_sbir.xlsx', 'aggregate_sttr.xlsx']
-    aggregate_sbir = pd.read_excel(file_paths[0])
-    aggregate_sttr = pd.read_excel(file_paths[1])
-    aggregate = pd.concat([aggregate_sbir, aggregate_sttr])
-    return aggregate[['legal-business-name', 'city', 'state']].drop_duplicates()
-
-
-# Helper function to normalize strings
-def normalize(s):
-    return s.lower().replace('.', '').replace(',', '')
-
-
-# Function to find the best match for a given firm in the data
-def find_match(firm, data):
-    normal_firm = normalize(firm)
-    highest = process.extractOne(normal_firm, data['Company-normalized'], scorer=fuzz.ratio)
-    matched_row = data[data['Company-normalized'] == highest[0]]
-    company = matched_row['Company'].values[0]
-    city = matched_row['City'].values[0]
-    state = matched_row['State'].values[0]
-    return firm, company, city, state, highest[1]
-
-
-# Helper function to unpack parameters and find a match
-def unpack_and_find_match(params):
-    return find_match(*params)
-
-
-# Function to read company name data from SBIR system and perform fuzzy matching
-def read_companies(file_path='award_data.csv', fuzz_match='fuzz_match.csv'):
-    if os.path.exists(fuzz_match):
-        if os.path.exists('manual_record.xlsx'):
-            update_fuzz_match()
-        df = pd.read_csv(fuzz_match).fillna("")
-        firms = df['FPDS_legal_business_name'].unique().tolist()
-        firm_company_dict = df.set_index('FPDS_legal_business_name')['search_keyword'].to_dict()
-        return firms, firm_company_dict
-    firms_df = read_businesses()
-    firms = firms_df['legal-business-name'].values
-    data = pd.read_csv(file_path)
-    data = data[data['Company'].apply(lambda x: isinstance(x, str))]
-    data['Company-normalized'] = data['Company'].apply(normalize)
-
-    # Prepare data for find_match function
-    match_data = [(firm, data[['Company', 'Company-normalized', 'City', 'State']]) for firm in firms]
-
-    with ProcessPoolExecutor() as executor:
-        results = list(tqdm(executor.map(unpack_and_find_match, match_data), total=len(firms)))
-
-    df = pd.DataFrame(results, columns=['FPDS_legal_business_name', 'SBIR_company', 'SBIR_city', 'SBIR_state',
-                                        'fuzz_score'])
-    firms_df = firms_df.rename(columns={'legal-business-name': 'FPDS_legal_business_name', 'city': 'FPDS_city',
-                                        'state': 'FPDS_state'})
-    df = pd.merge(firms_df, df, on='FPDS_legal_business_name')
-    df = df[['FPDS_legal_business_name', 'SBIR_company', 'FPDS_city', 'FPDS_state', 'SBIR_city', 'SBIR_state',
-             'fuzz_score']]
-    df['search_keyword'] = ''
-    df.loc[(df['fuzz_score'] > 95) | (
-            (df['fuzz_score'] > 70) & (df['FPDS_city'].str.lower() == df['SBIR_city'].str.lower())
-            & (df['FPDS_state'] == df['SBIR_state'])), 'search_keyword'] = df[
-        'SBIR_company']
-    df.to_csv('fuzz_match.csv', index=False)
-    firms = df['FPDS_legal_business_name'].unique().tolist()
-    firm_company_dict = df.set_index('FPDS_legal_business_name')['SBIR_company'].to_dict()
-    if os.path.exists('manual_record.xlsx'):
-        update_fuzz_match()
-    return firms, firm_company_dict
-
-
-# Function to update the fuzzy match data with manual records
-def update_fuzz_match(fuzz_match='fuzz_match.csv', manual='manual_record.xlsx'):
-    manual = pd.read_excel(manual, 'Manual')
-    fuzz_match = pd.read_csv(fuzz_match)
-    map_dict = manual.set_index('FPDS_legal_business_name')['SBIR_company'].to_dict()
-    fuzz_match.loc[fuzz_match['FPDS_legal_business_name'].isin(map_dict.keys()), 'search_keyword'] = \
-        fuzz_match['FPDS_legal_business_name'].map(map_dict)
-    fuzz_match.to_csv('fuzz_match.csv', index=False)
-
-
 # Function to write contracts to a CSV file
 def write_csv(contracts, csv_file_path='sbir_phase_i.csv'):
     """
@@ -242,17 +237,22 @@ def write_csv(contracts, csv_file_path='sbir_phase_i.csv'):
     :param contracts:
     :return: output.csv
     """
-    with open(csv_file_path, 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=['business', 'year', 'agency', 'url'])
+    write_records(contracts, csv_file_path, COLUMNS, converters=FORMATTERS)
 
-        # Write the header row
-        writer.writeheader()
+    print('CSV file has been generated.')
 
-        # Write the contract data
-        for contract in contracts:
-            writer.writerow(vars(contract))
 
-    print('CSV file has been generated.')
+# Function to write contracts to a Parquet file
+def write_parquet(contracts, parquet_file_path='sbir.parquet'):
+    """
+    Write contracts to a Parquet file with an explicit schema.
+    :param parquet_file_path:
+    :param contracts:
+    :return: output.parquet
+    """
+    write_records(contracts, parquet_file_path, COLUMNS)
+
+    print('Parquet file has been generated.')
 
 
 # Function to write contracts to an Excel file
@@ -263,69 +263,25 @@ def write_xlsx(contracts, xlsx_file_path='sbir.xlsx'):
     :param contracts:
     :return: output.xlsx
     """
-    wb = Workbook()
-    sheet = wb.active
-
-    # Define the header row
-    header = ['FPDS_legal business name', 'SBIR_company', 'year', 'agency', 'amount', 'program', 'phase', 'url',
-              'contract ID', 'DUNS']
-    sheet.append(header)
-
-    # Write the contract data
-    for contract in contracts:
-        contract_data = []
-        for field in header:
-            if field == 'year':
-                field = 'award_year'
-            if field == 'FPDS_legal business name':
-                field = 'legal_business_name'
-            if field == 'SBIR_company':
-                field = 'company'
-            if field == 'contract ID':
-                field = 'contract_id'
-            value = getattr(contract, field)
-            contract_data.append(value)
-        sheet.append(contract_data)
-
-    # Save the workbook to an XLSX file
-    wb.save(xlsx_file_path)
+    write_records(contracts, xlsx_file_path, COLUMNS, converters=FORMATTERS)
 
     print('XLSX file has been generated.')
 
 
-# Function to process special cases in the contracts
-def process_specials(contracts='sbir.xlsx', award_data='award_data.csv'):
-    df_contracts = pd.read_excel(contracts)
-    df_award_data = pd.read_csv(award_data)
-
-    filtered_df = df_contracts[(df_contracts['SBIR_company'].notna()) & (df_contracts['year'].isna())]
-    indices_to_drop = filtered_df.index
-    df_contracts.drop(indices_to_drop, inplace=True)
-
-    for _, row in tqdm(filtered_df.iterrows(), total=filtered_df.shape[0]):
-        matching_rows = df_award_data[df_award_data['Company'] == row['SBIR_company']]
-        for _, matching_row in matching_rows.iterrows():
-            new_row = pd.DataFrame({
-                'FPDS_legal business name': [row['FPDS_legal business name']],
-                'SBIR_company': [row['SBIR_company']],
-                'year': [matching_row['Award Year']],
-                'agency': [matching_row['Agency']],
-                'amount': [matching_row['Award Amount']],
-                'program': [matching_row['Program']],
-                'phase': [matching_row['Phase']],
-                'url': "",
-                'contract ID': [matching_row['Contract']],
-                'DUNS': [matching_row['Duns']],
-            })
-
-            df_contracts = pd.concat([df_contracts, new_row], ignore_index=True)
-
-    df_contracts.to_excel(contracts, index=False)
-
-
-if __name__ == '__main__':
+# Function to run the phase I & II crawl from the command line, also run by sbir_data.py sbir crawl
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crawl SBIR/STTR phase I & II awards from sbir.gov")
+    parser.add_argument('--resume', action='store_true', help="continue an interrupted crawl from the journal")
+    parser.add_argument('--xlsx', action='store_true', help="also export the contracts to sbir.xlsx")
+    parser.add_argument('--bulk', action='store_true',
+                        help="resolve awards from award_data.csv, only scrape companies missing from it")
+    args = parser.parse_args(argv)
     businesses, companies = read_companies()
-    res = crawl(businesses, companies)
+    joined = []
+    if args.bulk:
+        joined, businesses = join_awards(businesses, companies)
+        print(f'{len(joined)} contracts joined from the award data, {len(businesses)} firms left to scrape.')
+    res = crawl(businesses, companies, resume=args.resume)
     contract_companies = set(contract.company for contract in res)
     missing_firms = [firm for firm in businesses if companies.get(firm) not in contract_companies]
     if missing_firms:
@@ -333,7 +289,13 @@ if __name__ == '__main__':
         res = [contract for contract in res
                if contract.legal_business_name not in missing_companies]
         print(f'Retrying for {len(missing_firms)} missing firms.')
-        res += crawl(missing_firms, companies)
-    write_xlsx(res)
+        journal.add('firm', missing_firms, reset=True)
+        res += crawl(missing_firms, companies, resume=True)
+    res = joined + res
+    write_parquet(res)
     print('total contracts: ' + str(len(res)))
-    process_specials()
+    process_specials(xlsx_file_path='sbir.xlsx' if args.xlsx else None)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 import pandas as pd
 from tqdm import tqdm
 from fuzzywuzzy import process, fuzz
+from award_store import AwardStore
 
 # legacy
 
@@ -12,7 +13,7 @@ def normalize(s):
 aggregate_sbir = pd.read_excel('aggregate_sbir.xlsx')
 aggregate_sttr = pd.read_excel('aggregate_sttr.xlsx')
 aggregate = pd.concat([aggregate_sbir, aggregate_sttr])
-data = pd.read_csv('award_data.csv')
+data = AwardStore.load_or_import().frame()
 data = data[data['Company'].apply(lambda x: isinstance(x, str))]
 
 
@@ -0,0 +1,86 @@
+import argparse
+import os
+import sys
+
+import pandas as pd
+from award_store import AwardStore
+from matcher import CompanyMatcher
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.sinks import read_table
+
+
+# Function to read business name data from FPDS system
+def read_businesses(file_paths=None):
+    if file_paths is None:
+        file_paths = ['aggregate_sbir.parquet', 'aggregate_sttr.parquet']
+    aggregate_sbir = read_table(file_paths[0], columns=['legal-business-name', 'city', 'state'])
+    aggregate_sttr = read_table(file_paths[1], columns=['legal-business-name', 'city', 'state'])
+    aggregate = pd.concat([aggregate_sbir, aggregate_sttr])
+    return aggregate[['legal-business-name', 'city', 'state']].drop_duplicates()
+
+
+# Function to find the best match in the data for every firm
+def find_matches(firms, data):
+    rows, scores = CompanyMatcher(data['Company']).top_k(firms)
+    matched = data.iloc[rows[:, 0]]
+    return list(zip(firms, matched['Company'], matched['City'], matched['State'], scores[:, 0]))
+
+
+# Function to read company name data from SBIR system and perform fuzzy matching
+def read_companies(file_path='award_data.csv', fuzz_match='fuzz_match.csv'):
+    if os.path.exists(fuzz_match):
+        if os.path.exists('manual_record.xlsx'):
+            update_fuzz_match()
+        df = pd.read_csv(fuzz_match).fillna("")
+        firms = df['FPDS_legal_business_name'].unique().tolist()
+        firm_company_dict = df.set_index('FPDS_legal_business_name')['search_keyword'].to_dict()
+        return firms, firm_company_dict
+    firms_df = read_businesses()
+    firms = firms_df['legal-business-name'].values
+    data = AwardStore.load_or_import(file_path).frame(['Company', 'City', 'State'])
+    data = data[data['Company'].notna()]
+    results = find_matches(firms, data)
+
+    df = pd.DataFrame(results, columns=['FPDS_legal_business_name', 'SBIR_company', 'SBIR_city', 'SBIR_state',
+                                        'fuzz_score'])
+    firms_df = firms_df.rename(columns={'legal-business-name': 'FPDS_legal_business_name', 'city': 'FPDS_city',
+                                        'state': 'FPDS_state'})
+    df = pd.merge(firms_df, df, on='FPDS_legal_business_name')
+    df = df[['FPDS_legal_business_name', 'SBIR_company', 'FPDS_city', 'FPDS_state', 'SBIR_city', 'SBIR_state',
+             'fuzz_score']]
+    df['search_keyword'] = ''
+    df.loc[(df['fuzz_score'] > 95) | (
+            (df['fuzz_score'] > 70) & (df['FPDS_city'].str.lower() == df['SBIR_city'].str.lower())
+            & (df['FPDS_state'] == df['SBIR_state'])), 'search_keyword'] = df[
+        'SBIR_company']
+    df.to_csv('fuzz_match.csv', index=False)
+    firms = df['FPDS_legal_business_name'].unique().tolist()
+    firm_company_dict = df.set_index('FPDS_legal_business_name')['SBIR_company'].to_dict()
+    if os.path.exists('manual_record.xlsx'):
+        update_fuzz_match()
+    return firms, firm_company_dict
+
+
+# Function to update the fuzzy match data with manual records
+def update_fuzz_match(fuzz_match='fuzz_match.csv', manual='manual_record.xlsx'):
+    manual = pd.read_excel(manual, 'Manual')
+    fuzz_match = pd.read_csv(fuzz_match)
+    map_dict = manual.set_index('FPDS_legal_business_name')['SBIR_company'].to_dict()
+    fuzz_match.loc[fuzz_match['FPDS_legal_business_name'].isin(map_dict.keys()), 'search_keyword'] = \
+        fuzz_match['FPDS_legal_business_name'].map(map_dict)
+    fuzz_match.to_csv('fuzz_match.csv', index=False)
+
+
+# Function to match FPDS business names to SBIR companies from the command line, also run by sbir_data.py sbir match
+def match_main(argv=None):
+    parser = argparse.ArgumentParser(description="Match FPDS business names to SBIR companies in fuzz_match.csv, "
+                                                 "or apply the manual records to an existing one")
+    parser.parse_args(argv)
+    firms, companies = read_companies()
+    matched = sum(1 for firm in firms if companies.get(firm))
+    print(f'{matched} of {len(firms)} firms matched to an SBIR company.')
+
+
+if __name__ == '__main__':
+    match_main()
@@ -0,0 +1,103 @@
+import argparse
+import os
+import sys
+
+import pandas as pd
+from award_store import AwardStore
+from contract import Contract
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.parsing import parse_amount, parse_int, readable_frame, typed_frame
+from common.sinks import read_table, write_frame
+
+# Award data columns copied into back-filled contracts by process_specials
+AWARD_DATA_COLUMNS = {
+    'Award Year': 'year',
+    'Agency': 'agency',
+    'Award Amount': 'amount',
+    'Program': 'program',
+    'Phase': 'phase',
+    'Contract': 'contract ID',
+    'Duns': 'DUNS',
+}
+
+
+# Function to read the award data columns copied into contracts, with amounts in cents and years as integers
+def read_award_data(store):
+    df = store.frame(['Company'] + list(AWARD_DATA_COLUMNS)).rename(columns=AWARD_DATA_COLUMNS)
+    # award amounts are in dollars in the award data
+    df['amount'] = (pd.to_numeric(df['amount'], errors='coerce') * 100).round().astype('Int64')
+    df['year'] = pd.to_numeric(df['year'], errors='coerce').astype('Int64')
+    return df
+
+
+# Function to resolve the awards of matched companies from the award data instead of scraping sbir.gov
+# Every company is looked up in the company index of the award store, firms whose company is missing from the award
+# data are returned to be scraped
+def join_awards(firms, name_dict, award_data='award_data.csv'):
+    store = AwardStore.load_or_import(award_data)
+    df = read_award_data(store)
+    text_columns = ['agency', 'phase', 'program', 'contract ID', 'DUNS']
+    df[text_columns] = df[text_columns].astype(object).fillna("")
+    contracts = []
+    missing_firms = []
+    for firm in firms:
+        company = name_dict[firm]
+        if company == "":
+            contract = Contract()
+            contract.set_business(firm)
+            contracts.append(contract)
+            continue
+        rows = store.company_rows(company)
+        if not len(rows):
+            missing_firms.append(firm)
+            continue
+        for record in df.iloc[rows].to_dict('records'):
+            contract = Contract()
+            contract.set_business(firm)
+            contract.set_company(company)
+            contract.set_agency(record['agency'])
+            contract.set_award_year(parse_int(record['year']))
+            contract.set_amount(parse_amount(record['amount']))
+            contract.set_phase(record['phase'])
+            contract.set_program(record['program'])
+            contract.set_conract_id(record['contract ID'])
+            contract.set_DUNS(record['DUNS'])
+            contracts.append(contract)
+    return contracts, missing_firms
+
+
+# Function to process special cases in the contracts
+# Firms matched to an SBIR company without any scraped award are back-filled from the award data in one merge
+# The contracts file is rewritten in place, with an optional XLSX export
+def process_specials(contracts='sbir.parquet', award_data='award_data.csv', xlsx_file_path=None):
+    df_contracts = typed_frame(read_table(contracts), amounts=['amount'], integers=['year'])
+    df_award_data = read_award_data(AwardStore.load_or_import(award_data))
+
+    filtered = (df_contracts['SBIR_company'].notna()) & (df_contracts['year'].isna())
+    filtered_df = df_contracts.loc[filtered, ['FPDS_legal business name', 'SBIR_company']]
+
+    # a left merge keeps the order of the void rows, and the award data order within each company
+    new_rows = filtered_df.merge(df_award_data, how='left', left_on='SBIR_company', right_on='Company')
+    new_rows = new_rows[new_rows['Company'].notna()]
+    new_rows['url'] = ""
+    new_rows = new_rows.reindex(columns=df_contracts.columns)
+
+    df_contracts = pd.concat([df_contracts[~filtered], new_rows], ignore_index=True)
+
+    write_frame(df_contracts, os.path.splitext(contracts)[0] + '.parquet')
+    if xlsx_file_path:
+        readable_frame(df_contracts, amounts=['amount']).to_excel(xlsx_file_path, index=False)
+
+
+# Function to process special cases from the command line, also run by sbir_data.py sbir specials
+def specials_main(argv=None):
+    parser = argparse.ArgumentParser(description="Back-fill firms without scraped awards in sbir.parquet from the "
+                                                 "award data")
+    parser.add_argument('--xlsx', action='store_true', help="also export the contracts to sbir.xlsx")
+    args = parser.parse_args(argv)
+    process_specials(xlsx_file_path='sbir.xlsx' if args.xlsx else None)
+
+
+if __name__ == '__main__':
+    specials_main()
@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process, utils
+
+logger = logging.getLogger(__name__)
+
+# Queries scored per cdist call, bounds the score matrix to BATCH_SIZE x number of unique names
+BATCH_SIZE = 256
+# Candidate index over the award data company names, rebuilt when the names change
+INDEX_PATH = 'award_data_index.npz'
+# Candidates kept per query by the index before exact scoring
+CANDIDATES = 300
+
+
+# Helper function to normalize strings
+def normalize(s):
+    return s.lower().replace('.', '').replace(',', '')
+
+
+# Helper function to list the distinct character trigrams of a processed name, padded like pg_trgm
+def trigrams(s):
+    s = '  ' + s + ' '
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+# Helper function to hash a list of names
+def fingerprint(choices):
+    return hashlib.sha1('\n'.join(choices).encode('utf-8')).hexdigest()
+
+
+class TrigramIndex:
+    """
+    Character trigram inverted index over a list of names, used to block fuzzy matching.
+
+    Postings are stored in CSR form: the names containing trigram t are indices[indptr[t]:indptr[t + 1]]. The
+    trigrams a query shares with every name are counted with one bincount over the postings of its trigrams, and the
+    candidates are the names with the best Dice coefficient, for whole-name scorers, together with the names
+    containing the most query trigrams, for partial scorers.
+
+    :param keys: trigrams, in id order
+    :param indptr: offsets of the postings of every trigram
+    :param indices: name ids of all postings
+    :param lengths: number of distinct trigrams of every name
+    :param fingerprint: hash of the indexed names, to detect a stale index on disk
+    """
+
+    def __init__(self, keys, indptr, indices, lengths, fingerprint):
+        self.keys = keys
+        self.ids = {key: i for i, key in enumerate(keys)}
+        self.indptr = indptr
+        self.indices = indices
+        self.lengths = lengths
+        self.size = len(lengths)
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, choices):
+        ids = {}
+        term_ids = []
+        lengths = np.zeros(len(choices), dtype=np.int32)
+        for doc, choice in enumerate(choices):
+            grams = trigrams(choice)
+            lengths[doc] = len(grams)
+            term_ids.extend(ids.setdefault(gram, len(ids)) for gram in grams)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        doc_ids = np.repeat(np.arange(len(choices), dtype=np.int32), lengths)
+        order = np.argsort(term_ids, kind='stable')
+        indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(ids)), out=indptr[1:])
+        return cls(list(ids), indptr, doc_ids[order], lengths, fingerprint(choices))
+
+    def save(self, path):
+        np.savez(path, keys=np.array(self.keys, dtype=str), indptr=self.indptr, indices=self.indices,
+                 lengths=self.lengths, fingerprint=self.fingerprint)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f['keys'].tolist(), f['indptr'], f['indices'], f['lengths'], str(f['fingerprint']))
+
+    @classmethod
+    def load_or_build(cls, choices, path=INDEX_PATH):
+        """
+        Load the index from disk, or build and save it when it is missing or was built from other names.
+        """
+        if os.path.exists(path):
+            index = cls.load(path)
+            if index.size == len(choices) and index.fingerprint == fingerprint(choices):
+                return index
+            logger.info(f"Names changed since {path} was built, rebuilding it")
+        index = cls.build(choices)
+        index.save(path)
+        return index
+
+    def candidates(self, query, limit=CANDIDATES):
+        """
+        Ids of the candidate names of a processed query, in ascending order.
+        """
+        grams = trigrams(query)
+        terms = np.array([self.ids[gram] for gram in grams if gram in self.ids], dtype=np.int64)
+        if not len(terms):
+            return terms
+        postings = np.concatenate([self.indices[self.indptr[t]:self.indptr[t + 1]] for t in terms])
+        counts = np.bincount(postings, minlength=self.size)
+        hits = np.flatnonzero(counts)
+        if len(hits) <= limit:
+            return hits
+        shared = counts[hits]
+        dice = shared / (len(grams) + self.lengths[hits])
+        return np.union1d(hits[np.argpartition(-dice, limit - 1)[:limit]],
+                          hits[np.argpartition(-shared, limit - 1)[:limit]])
+
+
+class CompanyMatcher:
+    """
+    Fuzzy matcher of company names against the SBIR award data.
+
+    Names are normalized and processed once, deduplicated, and every batch of queries is scored against the unique
+    names in a single multithreaded rapidfuzz cdist call. Matches are returned as row positions, so details such as
+    city and state are plain index lookups.
+
+    With an index path, each query is first narrowed to the names sharing the most character trigrams with it and
+    only those candidates are scored exactly, instead of every name. This pays off for costly scorers such as WRatio;
+    plain ratio over every name is bit-parallel in rapidfuzz and usually faster without the index.
+
+    :param names: company names, in the order of the rows they come from
+    :param index_path: optional path of the persisted trigram index
+    :param candidates: candidates kept per query when the index is used
+    """
+
+    def __init__(self, names, index_path=None, candidates=CANDIDATES):
+        processed = [utils.default_process(normalize(name)) for name in names]
+        codes, uniques = pd.factorize(pd.Series(processed, dtype=object))
+        _, first = np.unique(codes, return_index=True)
+        self.choices = list(uniques)
+        # row of the first occurrence of every unique name, like extractOne returning the first best choice
+        self.rows = first
+        self.candidates = candidates
+        self.index = TrigramIndex.load_or_build(self.choices, index_path) if index_path else None
+
+    def __len__(self):
+        return len(self.choices)
+
+    def top_k(self, queries, k=1, scorer=fuzz.ratio, batch_size=BATCH_SIZE, workers=-1):
+        """
+        Find the best matching rows for every query.
+
+        Scores are rounded to integers like fuzzywuzzy's, and ties keep the order of the rows.
+
+        :param queries: company names to look up
+        :param k: number of matches per query
+        :param scorer: rapidfuzz scorer
+        :param batch_size: number of queries scored per call
+        :param workers: scoring threads, -1 uses every core
+        :return: (rows, scores) arrays of shape (len(queries), k)
+        """
+        queries = [utils.default_process(normalize(query)) for query in queries]
+        k = min(k, len(self.choices))
+        rows = np.zeros((len(queries), k), dtype=np.int64)
+        scores = np.zeros((len(queries), k), dtype=np.int64)
+        if self.index is not None:
+            for i, query in enumerate(queries):
+                rows[i], scores[i] = self._top_k_blocked(query, k, scorer)
+            return rows, scores
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+            matrix = np.rint(process.cdist(batch, self.choices, scorer=scorer, workers=workers))
+            for offset, row_scores in enumerate(matrix):
+                best = self._best(row_scores, k)
+                rows[start + offset] = self.rows[best]
+                scores[start + offset] = row_scores[best]
+        return rows, scores
+
+    def _top_k_blocked(self, query, k, scorer):
+        candidates = self.index.candidates(query, max(self.candidates, k))
+        if len(candidates) < k:
+            # too few names share a trigram with the query, score it against every name
+            candidates = np.arange(len(self.choices))
+        row_scores = np.rint(process.cdist([query], [self.choices[i] for i in candidates], scorer=scorer,
+                                           workers=1)[0])
+        best = self._best(row_scores, k)
+        return self.rows[candidates[best]], row_scores[best]
+
+    @staticmethod
+    def _best(row_scores, k):
+        if k == 1:
+            return np.array([np.argmax(row_scores)])
+        threshold = np.partition(row_scores, -k)[-k]
+        candidates = np.flatnonzero(row_scores >= threshold)
+        # stable sort, so equal scores stay in row order
+        return candidates[np.argsort(-row_scores[candidates], kind='stable')[:k]]
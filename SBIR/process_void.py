@@ -1,37 +1,56 @@
+import argparse
+import os
+import sys
+
 import pandas as pd
-from fuzzywuzzy import process
-from crawler import normalize
+from rapidfuzz import fuzz
+from award_store import AwardStore
+from matcher import CompanyMatcher, INDEX_PATH
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.sinks import read_table
+
+
+# Function to list the companies with void records in the scraped SBIR data
+def read_void_companies(path='sbir.parquet'):
+    df = read_table(path)
+    df_copy = df.drop(columns='FPDS_legal business name')
+    mask = df_copy.isnull().all(axis=1)
+    empty_rows = df[mask]['FPDS_legal business name']
+    return empty_rows.tolist()
+
+
+# Function to get the top 5 matches for every given company using a new fuzzy matching algorithm
+def get_top_matches(matcher, names, companies, limit=5):
+    rows, scores = matcher.top_k(companies, k=limit, scorer=fuzz.WRatio)
+    return [[(names[row], score) for row, score in zip(company_rows, company_scores)]
+            for company_rows, company_scores in zip(rows, scores)]
 
-# Load downloaded award data from SBIR website
-data = pd.read_csv('award_data.csv')
-data['Company'] = data['Company'].astype(str)
-original_names = {normalize(name): name for name in data['Company']}
-companies = pd.Series(list(original_names.keys())).drop_duplicates()
 
-# Load scraped SBIR data to deal with companies with void records
-df = pd.read_excel('sbir.xlsx')
-df_copy = df.drop(columns='FPDS_legal business name')
-mask = df_copy.isnull().all(axis=1)
-empty_rows = df[mask]['FPDS_legal business name']
-void_companies = empty_rows.tolist()
+# Function to save the matches of companies with void records to an Excel file, also run by sbir_data.py sbir void
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find the top 5 SBIR companies for every firm with void records")
+    parser.parse_args(argv)
 
+    # Load the company names of the award data downloaded from the SBIR website
+    data = AwardStore.load_or_import().frame(['Company'])
+    data['Company'] = data['Company'].astype(str)
+    matcher = CompanyMatcher(data['Company'], index_path=INDEX_PATH)
 
-# Function to get the top 5 matches for a given company using a new fuzzy matching algorithm
-def get_top_matches(company):
-    matches = process.extract(normalize(company), companies, limit=5)
-    matches = [(original_names[match], score) for match, score, _ in matches]
-    return matches
+    # Load scraped SBIR data to deal with companies with void records
+    void_companies = read_void_companies()
 
+    matched_companies = dict(zip(void_companies, get_top_matches(matcher, data['Company'].values, void_companies)))
+    df_matched_companies = pd.DataFrame(matched_companies).T
 
-# Execute the script and save the matches of companies with void records to an Excel file
-matched_companies = {company: get_top_matches(company) for company in void_companies}
-df_matched_companies = pd.DataFrame(matched_companies).T
+    df_matched_companies = df_matched_companies.applymap(lambda x: x[0] if x else "")
 
-df_matched_companies = df_matched_companies.applymap(lambda x: x[0] if x else "")
+    df_matched_companies.reset_index(level=0, inplace=True)
 
-df_matched_companies.reset_index(level=0, inplace=True)
+    df_matched_companies.columns = ['company', 'top1', 'top2', 'top3', 'top4', 'top5']
 
-df_matched_companies.columns = ['company', 'top1', 'top2', 'top3', 'top4', 'top5']
+    df_matched_companies.to_excel('void_companies.xlsx', index=False)
 
-df_matched_companies.to_excel('void_companies.xlsx', index=False)
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+import hashlib
+import re
+import time
+import zlib
+
+from common.config import load_config
+from common.database import ThreadLocalDatabase
+from common.http import get_session
+
+# search listings pick up new modifications and awards
+SEARCH_PATTERNS = [r'fpds\.gov/ezsearch/(search\.do|fpdsportal)\?.*\bq=', r'sbir\.gov/sbirsearch/award/']
+SEARCH_TTL = 24 * 3600
+
+# URL classes and how long a cached response stays valid in seconds, first match wins. None never expires.
+TTL_RULES = [(pattern, SEARCH_TTL) for pattern in SEARCH_PATTERNS] + [
+    # contract and award detail pages are historical records and never change
+    (r'fpds\.gov/', None),
+    (r'sbir\.gov/', None),
+]
+DEFAULT_TTL = 24 * 3600
+
+
+class ResponseCache(ThreadLocalDatabase):
+    """
+    Persistent response cache keyed by URL, backed by SQLite with zlib compressed bodies.
+    A disabled cache never opens its database file.
+    """
+
+    schema = "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, url TEXT, fetched_at REAL, body BLOB)"
+
+    def __init__(self, path='http_cache.sqlite', ttl_rules=None, enabled=True, default_ttl=DEFAULT_TTL):
+        super().__init__(path)
+        self.enabled = enabled
+        self.ttl_rules = [(re.compile(pattern), ttl) for pattern, ttl in (ttl_rules or TTL_RULES)]
+        self.default_ttl = default_ttl
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def ttl(self, url):
+        """
+        Look up how long a response for the given URL stays valid.
+
+        :param url: requested URL
+        :return: TTL in seconds, or None if the response never expires
+        """
+        for pattern, ttl in self.ttl_rules:
+            if pattern.search(url):
+                return ttl
+        return self.default_ttl
+
+    def get(self, url):
+        """
+        Return the cached body for a URL, or None if it is missing or expired.
+        """
+        if not self.enabled:
+            return None
+        row = self._connection().execute("SELECT fetched_at, body FROM responses WHERE key = ?",
+                                         (self.key(url),)).fetchone()
+        if row is None:
+            return None
+        fetched_at, body = row
+        ttl = self.ttl(url)
+        if ttl is not None and time.time() - fetched_at > ttl:
+            return None
+        return zlib.decompress(body).decode('utf-8')
+
+    def put(self, url, text):
+        if not self.enabled:
+            return
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO responses (key, url, fetched_at, body) VALUES (?, ?, ?, ?)",
+                         (self.key(url), url, time.time(), zlib.compress(text.encode('utf-8'))))
+
+    def invalidate(self, url):
+        """
+        Drop a cached response, e.g. when the page turned out to be incomplete.
+        """
+        if not self.enabled:
+            return
+        with self._connection() as conn:
+            conn.execute("DELETE FROM responses WHERE key = ?", (self.key(url),))
+
+    def fetch(self, url, session=None, timeout=60):
+        """
+        Return the body of a URL from the cache, downloading and storing it on a miss.
+        Only successful responses are stored.
+
+        :param url: URL to fetch
+        :param session: optional requests.Session to download with, defaults to the shared pooled session
+        :param timeout: request timeout in seconds
+        :return: response body as text
+        """
+        text = self.get(url)
+        if text is not None:
+            return text
+        resp = (session or get_session()).get(url, timeout=timeout)
+        if resp.status_code == 200:
+            self.put(url, resp.text)
+        return resp.text
+
+
+def parse_ttl(value, default):
+    """
+    Parse a TTL option in seconds, 'never' for responses that never expire.
+    """
+    if value is None or value == '':
+        return default
+    return None if value.lower() == 'never' else int(value)
+
+
+def load_cache(config=None):
+    """
+    Build the response cache of a crawler from the [cache] section of settings.ini.
+
+    path and enabled select the database file and switch caching off, search_ttl sets how long the search listings
+    of both sites stay valid and default_ttl applies to URLs no rule matches.
+
+    :param config: optional configparser.ConfigParser, defaults to load_config()
+    :return: ResponseCache
+    """
+    config = config or load_config()
+    settings = config['cache'] if config.has_section('cache') else {}
+    search_ttl = parse_ttl(settings.get('search_ttl'), SEARCH_TTL)
+    ttl_rules = [(pattern, search_ttl if pattern in SEARCH_PATTERNS else ttl) for pattern, ttl in TTL_RULES]
+    return ResponseCache(settings.get('path') or 'http_cache.sqlite', ttl_rules,
+                         enabled=config.getboolean('cache', 'enabled', fallback=True),
+                         default_ttl=parse_ttl(settings.get('default_ttl'), DEFAULT_TTL))
@@ -0,0 +1,33 @@
+import configparser
+import os
+
+# settings.ini at the repository root, can be pointed elsewhere with SBIR_DATA_CONFIG
+CONFIG_PATH = os.environ.get('SBIR_DATA_CONFIG',
+                             os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'settings.ini'))
+
+# threads per pool of the crawlers, pools are nested so a crawl keeps max_workers ** 2 connections alive
+MAX_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+
+def load_config(path=None):
+    """
+    Read the crawler settings. A missing file leaves every module on its built-in defaults.
+
+    :param path: path of the INI file, defaults to CONFIG_PATH
+    :return: configparser.ConfigParser
+    """
+    config = configparser.ConfigParser()
+    config.read(path or CONFIG_PATH)
+    return config
+
+
+def get_section(config, name, base=None):
+    """
+    Merge a section over its base section, e.g. 'throttle www.fpds.gov' over 'throttle'.
+
+    :return: dict of option name to raw string value
+    """
+    values = dict(config[base]) if base and config.has_section(base) else {}
+    if config.has_section(name):
+        values.update(config[name])
+    return values
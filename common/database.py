@@ -0,0 +1,30 @@
+import sqlite3
+import threading
+
+
+class ThreadLocalDatabase:
+    """
+    SQLite database file shared between threads: every thread opens its own connection to it.
+
+    Nothing is opened until the first query, so creating an instance at import time leaves no file behind.
+    Subclasses set `schema`, the statement creating their table if it does not exist yet.
+
+    :param path: path of the database file
+    """
+
+    schema = None
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=60)
+            conn.execute("PRAGMA journal_mode=WAL")
+            if self.schema:
+                with conn:
+                    conn.execute(self.schema)
+            self._local.conn = conn
+        return conn
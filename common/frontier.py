@@ -0,0 +1,69 @@
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+def canonicalize_url(url):
+    """
+    Canonical form of a URL: lower-case scheme and host, no fragment, and query parameters sorted by name.
+    Parameters with an empty value are kept, so the canonical URL still requests the same page.
+    """
+    parts = urlsplit(url.strip())
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ''))
+
+
+class Frontier:
+    """
+    Set of the URLs seen by a crawl, deduplicated by key across every worker thread.
+
+    Each URL is reduced to a key, by default its canonical form, and only the first URL with a given key is let
+    through, so every page is fetched once per run however many listings link to it. URLs are passed on as they
+    were first seen, so they still match the cache and earlier outputs.
+
+    :param key: function mapping a URL to its deduplication key
+    :param urls: optional URLs seen already, e.g. the detail pages finished by an interrupted run
+    """
+
+    def __init__(self, key=canonicalize_url, urls=()):
+        self.key = key
+        self._lock = threading.Lock()
+        self._seen = set()
+        self.filter(urls)
+
+    def __len__(self):
+        return len(self._seen)
+
+    def __contains__(self, url):
+        return self.key(url) in self._seen
+
+    def add(self, url):
+        """
+        Mark a URL as seen.
+
+        :return: True if no URL with the same key was seen before
+        """
+        return bool(self.filter([url]))
+
+    def filter(self, urls):
+        """
+        Mark URLs as seen and keep the new ones.
+
+        :param urls: URLs, e.g. the detail links of a listing page
+        :return: List of the URLs whose key was not seen before, in order, without duplicates
+        """
+        new = []
+        with self._lock:
+            for url in urls:
+                key = self.key(url)
+                if key not in self._seen:
+                    self._seen.add(key)
+                    new.append(url)
+        return new
+
+    def clear(self, urls=()):
+        """
+        Forget every URL, then mark the given ones as seen.
+        """
+        with self._lock:
+            self._seen.clear()
+        self.filter(urls)
@@ -0,0 +1,109 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from common.throttle import get_throttle
+
+# connections kept alive per host, should cover the number of worker threads sharing the session
+POOL_SIZE = 64
+TIME_OUT = 60
+
+# retries with exponential backoff: backoff_factor * 2 ** (retry - 1) seconds plus up to backoff_jitter seconds
+RETRY_TOTAL = 5
+BACKOFF_FACTOR = 1
+BACKOFF_JITTER = 1.0
+BACKOFF_MAX = 120
+# transient statuses worth retrying, a Retry-After header on them is honored
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_lock = threading.Lock()
+
+
+def make_retry(total=RETRY_TOTAL):
+    return Retry(total=total, backoff_factor=BACKOFF_FACTOR, backoff_jitter=BACKOFF_JITTER, backoff_max=BACKOFF_MAX,
+                 status_forcelist=RETRY_STATUSES, allowed_methods=frozenset(['GET']),
+                 respect_retry_after_header=True, raise_on_status=False)
+
+
+class ThrottledSession(requests.Session):
+    """
+    Session that passes every request through the rate limiter and concurrency controller of its host.
+
+    Responses that needed a retry count as congestion too, since urllib3 retries 429 and 5xx responses before the
+    final response is returned.
+    """
+
+    def request(self, method, url, *args, **kwargs):
+        throttle = get_throttle(urlsplit(url).hostname)
+        throttle.acquire()
+        start = time.monotonic()
+        ok = False
+        try:
+            resp = super().request(method, url, *args, **kwargs)
+            retries = getattr(resp.raw, 'retries', None)
+            ok = resp.status_code not in RETRY_STATUSES and not (retries and retries.history)
+            return resp
+        finally:
+            throttle.release(ok, time.monotonic() - start)
+
+
+def create_session(pool_size=POOL_SIZE, retry=None):
+    """
+    Create a throttled session with a keep-alive connection pool and adaptive retries.
+
+    :param pool_size: number of connections kept per host, sized to the number of worker threads
+    :param retry: urllib3 Retry policy, defaults to make_retry()
+    :return: requests.Session
+    """
+    session = ThrottledSession()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry or make_retry())
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """
+    Return the session shared by every crawler thread, creating it on first use.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+
+def configure(pool_size=POOL_SIZE, retry=None):
+    """
+    Replace the shared session, e.g. to size the pool to the number of workers before a crawl starts.
+    """
+    global _session
+    with _lock:
+        _session = create_session(pool_size, retry)
+        return _session
+
+
+def get(url, timeout=TIME_OUT):
+    return get_session().get(url, timeout=timeout)
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Delay before a retry, for clients that cannot use the urllib3 Retry policy.
+
+    :param attempt: number of the failed attempt, starting at 0
+    :param retry_after: value of a Retry-After header in seconds, if the server sent one
+    :return: delay in seconds
+    """
+    if retry_after is not None:
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+    return min(BACKOFF_FACTOR * 2 ** attempt + random.uniform(0, BACKOFF_JITTER), BACKOFF_MAX)
@@ -0,0 +1,75 @@
+import json
+import time
+
+from common.database import ThreadLocalDatabase
+
+# unit statuses
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Journal(ThreadLocalDatabase):
+    """
+    Work journal of crawl units (listing URLs, detail URLs, firms) with their status and parsed record.
+
+    Backed by SQLite so a killed run can be resumed: completed units are skipped and their records reloaded.
+    """
+
+    schema = ("CREATE TABLE IF NOT EXISTS units ("
+              "kind TEXT, key TEXT, status TEXT, record TEXT, updated_at REAL, PRIMARY KEY (kind, key))")
+
+    def __init__(self, path='journal.sqlite'):
+        super().__init__(path)
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM units")
+
+    def add(self, kind, keys, reset=False):
+        """
+        Register units as pending.
+
+        :param kind: unit kind, e.g. 'listing', 'detail' or 'firm'
+        :param keys: unit keys
+        :param reset: also set units that are already journaled back to pending
+        """
+        verb = "INSERT OR REPLACE" if reset else "INSERT OR IGNORE"
+        with self._connection() as conn:
+            conn.executemany(f"{verb} INTO units (kind, key, status, record, updated_at) VALUES (?, ?, ?, NULL, ?)",
+                             [(kind, key, PENDING, time.time()) for key in keys])
+
+    def mark(self, kind, key, status, record=None):
+        """
+        Record the status of a unit, with its parsed record once it is done.
+
+        :param record: JSON serializable record, dates are stored as ISO text
+        """
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO units (kind, key, status, record, updated_at) VALUES (?, ?, ?, ?, ?)",
+                         (kind, key, status, None if record is None else json.dumps(record, default=str), time.time()))
+
+    def status(self, kind, key):
+        row = self._connection().execute("SELECT status FROM units WHERE kind = ? AND key = ?",
+                                         (kind, key)).fetchone()
+        return row[0] if row else None
+
+    def keys(self, kind, status=None):
+        """
+        List the journaled keys of a kind, optionally only those with the given status.
+        """
+        if status is None:
+            rows = self._connection().execute("SELECT key FROM units WHERE kind = ?", (kind,))
+        else:
+            rows = self._connection().execute("SELECT key FROM units WHERE kind = ? AND status = ?", (kind, status))
+        return [row[0] for row in rows]
+
+    def records(self, kind):
+        """
+        Load the records of every completed unit of a kind.
+
+        :return: List of (key, record) tuples
+        """
+        rows = self._connection().execute("SELECT key, record FROM units WHERE kind = ? AND status = ?",
+                                          (kind, DONE))
+        return [(key, json.loads(record) if record is not None else None) for key, record in rows]
@@ -0,0 +1,126 @@
+import numbers
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+# date format of fpds.gov pages and of the XLSX/CSV exports
+DATE_FORMAT = '%m/%d/%Y'
+
+
+def _is_null(value):
+    if value is None or isinstance(value, str):
+        return not value
+    try:
+        # NaN and NaT are the only values not equal to themselves
+        return bool(value != value)
+    except TypeError:
+        # pandas.NA has no truth value
+        return True
+
+
+def parse_amount(value):
+    """
+    Parse a dollar amount into integer cents.
+
+    :param value: text such as '$1,234.50' or '-$798,094.00', or a number already in cents
+    :return: int, or None if there is no amount
+    """
+    if _is_null(value):
+        return None
+    if isinstance(value, numbers.Real):
+        return int(round(value))
+    text = str(value).strip()
+    digits = re.sub(r'[^0-9.]', '', text)
+    try:
+        cents = int((Decimal(digits) * 100).to_integral_value())
+    except InvalidOperation:
+        return None
+    return -cents if text.startswith(('-', '(')) else cents
+
+
+def format_amount(cents):
+    """
+    Format integer cents the way fpds.gov shows amounts, e.g. '-$798,094.00'.
+    """
+    if _is_null(cents):
+        return ''
+    cents = int(cents)
+    sign = '-' if cents < 0 else ''
+    return f'{sign}${abs(cents) // 100:,}.{abs(cents) % 100:02d}'
+
+
+def parse_date(value):
+    """
+    Parse a date.
+
+    :param value: text as MM/DD/YYYY or ISO format, or a date or datetime
+    :return: datetime.date, or None if there is no date
+    """
+    if _is_null(value):
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    for parse in (lambda t: datetime.strptime(t, DATE_FORMAT).date(), date.fromisoformat):
+        try:
+            return parse(text)
+        except ValueError:
+            pass
+    return None
+
+
+def format_date(value):
+    """
+    Format a date as MM/DD/YYYY, like the source pages.
+    """
+    value = parse_date(value)
+    return value.strftime(DATE_FORMAT) if value else ''
+
+
+def parse_int(value):
+    """
+    Parse an integer such as an award year.
+
+    :return: int, or None if there is no number
+    """
+    if _is_null(value):
+        return None
+    try:
+        return int(float(value))
+    except ValueError:
+        return None
+
+
+def typed_frame(df, amounts=(), dates=(), integers=()):
+    """
+    Convert columns of a DataFrame to their parsed types, e.g. after loading an export written before typed parsing.
+
+    :param amounts: columns converted to nullable integer cents
+    :param dates: columns converted to dates
+    :param integers: columns converted to nullable integers
+    :return: converted copy of the DataFrame
+    """
+    df = df.copy()
+    for column in amounts:
+        df[column] = df[column].map(parse_amount).astype('Int64')
+    for column in dates:
+        df[column] = df[column].map(parse_date)
+    for column in integers:
+        df[column] = df[column].map(parse_int).astype('Int64')
+    return df
+
+
+def readable_frame(df, amounts=(), dates=()):
+    """
+    Format typed columns of a DataFrame like the source pages, for XLSX exports.
+
+    :return: formatted copy of the DataFrame
+    """
+    df = df.copy()
+    for column in amounts:
+        df[column] = df[column].map(format_amount)
+    for column in dates:
+        df[column] = df[column].map(format_date)
+    return df
@@ -0,0 +1,65 @@
+import pandas as pd
+import pyarrow as pa
+
+from common.sinks import TEXT_TYPES, arrow_schema
+
+
+class RecordBatch:
+    """
+    Column-oriented container of slotted records, e.g. the contracts of a whole crawl.
+
+    Values are kept in one list per field instead of one object per record, and the batch converts to a DataFrame
+    or an Arrow table in bulk.
+
+    :param record_type: class of the records, with the field names in __slots__ and a from_dict() constructor
+    :param records: optional records to add
+    """
+
+    def __init__(self, record_type, records=()):
+        self.record_type = record_type
+        self.fields = record_type.__slots__
+        self.columns = {field: [] for field in self.fields}
+        self.extend(records)
+
+    def append(self, record):
+        for field, values in self.columns.items():
+            values.append(getattr(record, field))
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def __len__(self):
+        return len(self.columns[self.fields[0]])
+
+    def __iter__(self):
+        for row in zip(*self.columns.values()):
+            yield self.record_type.from_dict(dict(zip(self.fields, row)))
+
+    def to_frame(self, columns=None):
+        """
+        Convert the batch to a DataFrame.
+
+        :param columns: optional list of (column name, record attribute, type name) tuples, every field by default
+        :return: pandas.DataFrame
+        """
+        if columns is None:
+            return pd.DataFrame(self.columns, columns=list(self.fields))
+        return pd.DataFrame({name: self.columns[attribute] for name, attribute, _ in columns})
+
+    def to_arrow(self, columns):
+        """
+        Convert the batch to an Arrow table with the schema of the output columns. Empty strings become nulls, as in
+        ParquetSink.
+
+        :param columns: list of (column name, record attribute, type name) tuples
+        :return: pyarrow.Table
+        """
+        schema = arrow_schema(columns)
+        arrays = []
+        for (_, attribute, type_name), field in zip(columns, schema):
+            values = self.columns[attribute]
+            if type_name in TEXT_TYPES:
+                values = [value or None for value in values]
+            arrays.append(pa.array(values, type=field.type))
+        return pa.Table.from_arrays(arrays, schema=schema)
@@ -0,0 +1,303 @@
+import csv
+import json
+import operator
+import os
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# type names usable in column definitions
+ARROW_TYPES = {
+    'string': pa.string(),
+    'bool': pa.bool_(),
+    'int64': pa.int64(),
+    'float64': pa.float64(),
+    'date': pa.date32(),
+    # dictionary-encoded strings, for columns with few distinct values
+    'category': pa.dictionary(pa.int32(), pa.string()),
+}
+
+# text types, empty strings are stored as nulls
+TEXT_TYPES = ('string', 'category')
+
+
+def arrow_schema(columns):
+    """
+    Build the Arrow schema of an output file.
+
+    :param columns: list of (column name, record attribute, type name) tuples
+    :return: pyarrow.Schema
+    """
+    return pa.schema([(name, ARROW_TYPES[type_name]) for name, _, type_name in columns])
+
+
+def accessor(columns, converters=None):
+    """
+    Build a function returning the row of a record, in column order.
+
+    Attribute lookups are resolved once here instead of per field per row.
+
+    :param columns: list of (column name, record attribute, type name) tuples
+    :param converters: optional mapping of record attribute to a function applied to its value
+    :return: function mapping a record to a tuple of values
+    """
+    attributes = [attribute for _, attribute, _ in columns]
+    getter = operator.attrgetter(*attributes)
+    if len(attributes) == 1:
+        single = getter
+        getter = lambda record: (single(record),)
+    if not converters:
+        return getter
+    convert = [(index, converters[attribute]) for index, attribute in enumerate(attributes) if attribute in converters]
+
+    def get_row(record):
+        row = list(getter(record))
+        for index, func in convert:
+            row[index] = func(row[index])
+        return row
+
+    return get_row
+
+
+class RecordSink:
+    """
+    Base class of the streaming writers: records are accepted one at a time and written in batches.
+
+    :param path: path of the output file
+    :param columns: list of (column name, record attribute, type name) tuples
+    :param batch_size: number of records buffered before they are written
+    :param converters: optional mapping of record attribute to a function applied to its value
+    """
+
+    def __init__(self, path, columns, batch_size=1000, converters=None):
+        self.path = path
+        self.columns = columns
+        self.batch_size = batch_size
+        self.count = 0
+        self._row = accessor(columns, converters)
+        self._rows = []
+
+    def write(self, record):
+        self._rows.append(self._row(record))
+        self.count += 1
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        if self._rows:
+            self._write_rows(self._rows)
+            self._rows = []
+
+    def _write_rows(self, rows):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class CsvSink(RecordSink):
+    """
+    Write records to a CSV file. With append=True rows are added to an existing file, and the header is only
+    written when the file is new.
+    """
+
+    def __init__(self, path, columns, append=False, batch_size=100, converters=None):
+        super().__init__(path, columns, batch_size, converters)
+        new_file = not append or not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a' if append else 'w', newline='')
+        self._writer = csv.writer(self._file)
+        if new_file:
+            self._writer.writerow([name for name, _, _ in columns])
+
+    def _write_rows(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        super().close()
+        self._file.close()
+
+
+class JsonlSink(RecordSink):
+    """
+    Write records to a JSON Lines file, one object per record keyed by column name.
+    """
+
+    def __init__(self, path, columns, append=False, batch_size=100, converters=None):
+        super().__init__(path, columns, batch_size, converters)
+        self._names = [name for name, _, _ in columns]
+        self._file = open(path, 'a' if append else 'w', encoding='utf-8')
+
+    def _write_rows(self, rows):
+        self._file.writelines(json.dumps(dict(zip(self._names, row)), default=str) + '\n' for row in rows)
+        self._file.flush()
+
+    def close(self):
+        super().close()
+        self._file.close()
+
+
+class XlsxSink(RecordSink):
+    """
+    Write records to an Excel file with a write-only workbook, which streams rows to disk instead of keeping every
+    cell object in memory. The file is saved on close.
+    """
+
+    def __init__(self, path, columns, batch_size=1000, converters=None):
+        super().__init__(path, columns, batch_size, converters)
+        # imported on first use, openpyxl is slow to import and only needed for XLSX exports
+        from openpyxl import Workbook
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet()
+        self._sheet.append([name for name, _, _ in columns])
+
+    def _write_rows(self, rows):
+        for row in rows:
+            self._sheet.append(row)
+
+    def close(self):
+        super().close()
+        self._workbook.save(self.path)
+
+
+class ParquetSink(RecordSink):
+    """
+    Write records to a Parquet file with an explicit schema, one row group per batch.
+
+    Empty strings are stored as nulls, the same way they read back from an XLSX export.
+
+    :param path: path of the Parquet file
+    :param columns: list of (column name, record attribute, type name) tuples
+    :param batch_size: number of records per row group
+    """
+
+    def __init__(self, path, columns, batch_size=10000, converters=None):
+        super().__init__(path, columns, batch_size, converters)
+        self.schema = arrow_schema(columns)
+        self._strings = [type_name in TEXT_TYPES for _, _, type_name in columns]
+        self._writer = pq.ParquetWriter(path, self.schema)
+
+    def _write_rows(self, rows):
+        arrays = []
+        for values, is_string, field in zip(zip(*rows), self._strings, self.schema):
+            if is_string:
+                values = [value or None for value in values]
+            arrays.append(pa.array(values, type=field.type))
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        super().close()
+        self._writer.close()
+
+
+# writer for each output file extension
+SINKS = {
+    '.csv': CsvSink,
+    '.jsonl': JsonlSink,
+    '.xlsx': XlsxSink,
+    '.parquet': ParquetSink,
+}
+
+
+def open_sink(path, columns, **kwargs):
+    """
+    Open the streaming writer matching the extension of the output file.
+
+    :param path: path of a .parquet, .csv, .jsonl or .xlsx file
+    :param columns: list of (column name, record attribute, type name) tuples
+    :return: RecordSink
+    """
+    ext = os.path.splitext(path)[1]
+    if ext not in SINKS:
+        raise ValueError(f"Unsupported output file: {path}")
+    return SINKS[ext](path, columns, **kwargs)
+
+
+def write_records(records, path, columns, **kwargs):
+    """
+    Write records to an output file, in the format given by its extension.
+
+    A RecordBatch is written to Parquet as a single Arrow table.
+
+    :return: number of records written
+    """
+    if os.path.splitext(path)[1] == '.parquet' and hasattr(records, 'to_arrow') and not kwargs:
+        pq.write_table(records.to_arrow(columns), path)
+        return len(records)
+    with open_sink(path, columns, **kwargs) as sink:
+        sink.write_many(records)
+    return sink.count
+
+
+def _as_string(value):
+    if pd.isna(value):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _is_date_column(series):
+    values = series.dropna()
+    return len(values) > 0 and values.map(lambda value: isinstance(value, date)).all()
+
+
+def write_frame(df, path, columns=None):
+    """
+    Write a DataFrame to a Parquet file. Object columns are stored as strings, so columns that mix numbers read
+    from different sources still get a single type, except for columns of dates.
+
+    With columns, the file gets the same schema as a ParquetSink of those columns, e.g. when a crawler output is
+    rewritten: typed columns are kept and text columns stay dictionary-encoded.
+
+    :param columns: optional list of (column name, record attribute, type name) tuples
+    """
+    if columns is not None:
+        schema = arrow_schema(columns)
+        arrays = []
+        for (name, _, type_name), field in zip(columns, schema):
+            values = [None if pd.isna(value) else value for value in df[name].astype(object)]
+            if type_name in TEXT_TYPES:
+                values = [_as_string(value) or None for value in values]
+            arrays.append(pa.array(values, type=field.type))
+        pq.write_table(pa.Table.from_arrays(arrays, schema=schema), path)
+        return
+    df = df.copy()
+    for column in df.columns:
+        if df[column].dtype == object and not _is_date_column(df[column]):
+            df[column] = df[column].map(_as_string)
+    df.to_parquet(path, index=False)
+
+
+def read_table(path, columns=None):
+    """
+    Load an output file into a DataFrame.
+
+    Parquet files are preferred: when a .parquet file does not exist yet, the .xlsx export with the same name is
+    read instead. Nulls come back as NaN either way, as with read_excel.
+
+    :param path: path of a .parquet, .xlsx or .csv file
+    :param columns: optional list of columns to load
+    :return: pandas.DataFrame
+    """
+    root, ext = os.path.splitext(path)
+    if ext == '.parquet' and not os.path.exists(path) and os.path.exists(root + '.xlsx'):
+        path, ext = root + '.xlsx', '.xlsx'
+    if ext == '.parquet':
+        return pd.read_parquet(path, columns=columns).fillna(np.nan)
+    if ext == '.csv':
+        return pd.read_csv(path, usecols=columns)
+    return pd.read_excel(path, usecols=columns)
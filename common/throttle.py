@@ -0,0 +1,130 @@
+import logging
+import threading
+import time
+
+from common.config import load_config, get_section
+
+logger = logging.getLogger(__name__)
+
+# defaults for every host, overridden by the [throttle] and [throttle <host>] sections of settings.ini
+DEFAULTS = {
+    'rate': 10.0,
+    'burst': 20,
+    'initial_concurrency': 16,
+    'min_concurrency': 2,
+    'max_concurrency': 256,
+    'increase': 1.0,
+    'decrease': 0.5,
+    'latency_target': 10.0,
+    'cooldown': 5.0,
+}
+
+_throttles = {}
+_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Limit the request rate to `rate` per second, allowing bursts of up to `burst` requests.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AIMDController:
+    """
+    Concurrency limit with additive increase and multiplicative decrease.
+
+    Healthy responses raise the limit by `increase` per window of `limit` responses. Timeouts, 429s, 5xx responses
+    and responses slower than `latency_target` multiply it by `decrease`, at most once per `cooldown` seconds so a
+    burst of failures from the same window only backs off once.
+    """
+
+    def __init__(self, initial, minimum, maximum, increase, decrease, latency_target, cooldown):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, ok, latency):
+        """
+        Give back a slot and adjust the limit from the outcome of the request.
+
+        :param ok: False on timeouts, connection errors, 429 and 5xx responses
+        :param latency: request duration in seconds
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if ok and latency <= self.latency_target:
+                self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+            else:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self._last_decrease = now
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    logger.debug(f"Backing off to {int(self.limit)} concurrent requests")
+            self._cond.notify_all()
+
+
+class HostThrottle:
+    """
+    Rate limit and adaptive concurrency limit for a single host.
+    """
+
+    def __init__(self, settings):
+        self.bucket = TokenBucket(float(settings['rate']), int(settings['burst']))
+        self.controller = AIMDController(int(settings['initial_concurrency']), int(settings['min_concurrency']),
+                                         int(settings['max_concurrency']), float(settings['increase']),
+                                         float(settings['decrease']), float(settings['latency_target']),
+                                         float(settings['cooldown']))
+
+    def acquire(self):
+        self.controller.acquire()
+        self.bucket.acquire()
+
+    def release(self, ok, latency):
+        self.controller.release(ok, latency)
+
+
+def get_throttle(host, config=None):
+    """
+    Return the throttle shared by every request to a host, creating it from settings.ini on first use.
+
+    :param host: host name, e.g. www.fpds.gov
+    :param config: optional configparser.ConfigParser, defaults to load_config()
+    :return: HostThrottle
+    """
+    with _lock:
+        if host not in _throttles:
+            settings = {**DEFAULTS, **get_section(config or load_config(), f'throttle {host}', 'throttle')}
+            _throttles[host] = HostThrottle(settings)
+        return _throttles[host]
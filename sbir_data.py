@@ -0,0 +1,64 @@
+"""
+Command line entry point of the FPDS and SBIR pipelines.
+
+    python sbir_data.py fpds crawl|aggregate [options]
+    python sbir_data.py sbir match|crawl|void|specials|store [options]
+
+Only the module of the requested command is imported, so quick tasks do not pay for the crawler stack. Every
+command runs in the directory of its pipeline, where it reads and writes its files, and takes the same options as
+the script it runs; pass --help after a command to list them.
+"""
+import argparse
+import importlib
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# command: (directory, module, entry point, description)
+COMMANDS = {
+    'fpds': {
+        'crawl': ('FPDS', 'crawler', 'main', "crawl SBIR/STTR phase III contracts from fpds.gov"),
+        'aggregate': ('FPDS', 'aggregate', 'main', "aggregate contract modifications into one row per award"),
+    },
+    'sbir': {
+        'match': ('SBIR', 'fuzz_match', 'match_main', "match FPDS business names to SBIR companies"),
+        'crawl': ('SBIR', 'crawler', 'main', "crawl the phase I & II awards of the matched companies"),
+        'void': ('SBIR', 'process_void', 'main', "find candidate companies for firms with void records"),
+        'specials': ('SBIR', 'join', 'specials_main', "back-fill firms without awards from the award data"),
+        'store': ('SBIR', 'award_store', 'main', "import award_data.csv into the memory-mapped award store"),
+    },
+}
+
+
+def run(directory, module_name, entry_point, argv):
+    """
+    Import a pipeline module and run one of its entry points, from the directory of the pipeline.
+
+    :param directory: pipeline directory, relative to the repository root
+    :param module_name: module of the command, imported only now
+    :param entry_point: function of the module taking the remaining command line arguments
+    :param argv: remaining command line arguments
+    """
+    path = os.path.join(ROOT, directory)
+    os.chdir(path)
+    sys.path.insert(0, path)
+    module = importlib.import_module(module_name)
+    return getattr(module, entry_point)(argv)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='sbir_data.py', description="SBIR/STTR data pipelines")
+    pipelines = parser.add_subparsers(dest='pipeline', required=True)
+    for pipeline, commands in COMMANDS.items():
+        pipeline_parser = pipelines.add_parser(pipeline, help=f"{pipeline.upper()} pipeline")
+        subcommands = pipeline_parser.add_subparsers(dest='command', required=True)
+        for command, (_, _, _, description) in commands.items():
+            subcommands.add_parser(command, help=description, add_help=False)
+    args, rest = parser.parse_known_args(argv)
+    directory, module_name, entry_point, _ = COMMANDS[args.pipeline][args.command]
+    run(directory, module_name, entry_point, rest)
+
+
+if __name__ == '__main__':
+    main()